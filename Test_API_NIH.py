@@ -3,30 +3,18 @@ import os
 import requests
 import json
 from urllib.parse import urlparse
+from dedup import load_duplicate_ids
+from load_publications import extract_pmc_id
 
 # configuration
 INPUT_CSV = "publications.csv"   # your input CSV file
 OUTPUT_DIR = "data/SB_publication"            # folder to save results
 os.makedirs(OUTPUT_DIR, exist_ok=True)
-
-# extrack PMC ID from URL
-def extract_pmc_id(url):
-    """
-    Extracts the PMC ID from the URL.
-    Example URL: https://www.ncbi.nlm.nih.gov/pmc/articles/PMC11353732/
-    """
-    try:
-        parts = url.strip("/").split("/")  # remove trailing slash and split
-        for part in reversed(parts):
-            if part.startswith("PMC"):
-                return part
-        return None
-    except Exception as e:
-        print(f"Error extracting PMC ID from {url}: {e}")
-        return None
+DUPLICATE_IDS = load_duplicate_ids()  # from dedup.py; empty until it has been run
 
 # main loop
-with open(INPUT_CSV, newline='', encoding='utf-8') as csvfile:
+seen = set()
+with open(INPUT_CSV, newline='', encoding='utf-8-sig') as csvfile:
     reader = csv.DictReader(csvfile)
     for row in reader:
         title = row.get("Title", "").strip().replace("/", "_").replace("\\", "_")
@@ -36,6 +24,10 @@ with open(INPUT_CSV, newline='', encoding='utf-8') as csvfile:
         if not pmc_id:
             print(f"⚠️ Skipping: Could not extract PMC ID from URL ({url})")
             continue
+        if pmc_id in seen or pmc_id in DUPLICATE_IDS:
+            print(f"Skipping duplicate {pmc_id}")
+            continue
+        seen.add(pmc_id)
 
         api_url = f"https://www.ncbi.nlm.nih.gov/research/bionlp/RESTful/pmcoa.cgi/BioC_json/{pmc_id}/unicode"
         print(f"Fetching {pmc_id} ...")
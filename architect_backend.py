@@ -6,6 +6,10 @@ import asyncio
 from semantic_kernel import Kernel
 from semantic_kernel.connectors.ai.open_ai import AzureChatCompletion
 from semantic_kernel.functions.kernel_arguments import KernelArguments
+from dedup import canonical_records
+from load_publications import normalize_pmcid, extract_pmc_id
+from llm_scheduler import scheduler, BATCH, BATCH_TIMEOUT
+from summary_store import SUMMARY_PATH, load_summaries, get_summary, format_summary, file_hash
 
 # load env
 load_dotenv()
@@ -23,23 +27,10 @@ kernel.add_service(
     )
 )
 
-# helper function
-def extract_pmc_id(url: str) -> str | None:
-    """Extracts the PMC ID from a URL."""
-    try:
-        parts = url.strip("/").split("/")
-        for part in reversed(parts):
-            if part.startswith("PMC"):
-                return part
-        return None
-    except Exception as e:
-        print(f"Error extracting PMC ID from {url}: {e}")
-        return None
-
 def load_publications(csv_path: str) -> list[dict]:
-    """Load publications from CSV and extract PMC IDs."""
+    """Load publications from CSV and extract PMC IDs, one record per canonical paper."""
     records = []
-    with open(csv_path, newline='', encoding="utf-8") as f:
+    with open(csv_path, newline='', encoding="utf-8-sig") as f:  # the CSV starts with a BOM
         reader = csv.DictReader(f)
         for row in reader:
             url = row.get("Link", "").strip()
@@ -48,7 +39,7 @@ def load_publications(csv_path: str) -> list[dict]:
                 "url": url,
                 "pmcid": extract_pmc_id(url)
             })
-    return records
+    return canonical_records(records)
 
 def load_article_json(pmcid: str) -> dict | None:
     """Load article JSON for a given PMC ID."""
@@ -68,8 +59,8 @@ async def related_pmcs(user_input: str, records: list[dict]) -> list[str]:
         f"Provide a list of 5 related PMC IDs, separated by commas."
     )
 
-    response = await kernel.invoke_prompt(prompt_text, KernelArguments())
-    pmc_list = [pmc.strip() for pmc in str(response).split(",") if pmc.strip()]
+    response = await scheduler.run(lambda: kernel.invoke_prompt(prompt_text, KernelArguments()), prompt_text, BATCH, BATCH_TIMEOUT)
+    pmc_list = [normalize_pmcid(pmc) for pmc in str(response).split(",") if pmc.strip()]
     print("Related PMC IDs:", pmc_list)
     return pmc_list
 
@@ -97,14 +88,22 @@ def extract_text_from_json(pmcid: str) -> str:
 
     return text
 
-async def summarize_article(user_input, pmcid: str) -> str | None:
-    """Summarize an article by PMC ID."""
-    article_json = extract_text_from_json(pmcid)
-    if not article_json:
+async def summarize_article(user_input, pmcid: str, summaries: dict | None = None) -> str | None:
+    """Summarize an article by PMC ID, using its stored summary when it is up to date."""
+    path = f"data/SB_publication/{pmcid}.json"
+    summary = None
+    if summaries and os.path.exists(path):
+        summary = get_summary(summaries, pmcid, file_hash(path))
+
+    if summary:
+        article_text = format_summary(summary)
+    else:
+        article_text = extract_text_from_json(pmcid)
+    if not article_text:
         print(f"Article JSON for {pmcid} not found.")
         return None
-    prompt = f"Based on this user input: {user_input}, extract related information from the following article:\n\n{article_json}\n\n"
-    response = await kernel.invoke_prompt(prompt, KernelArguments())
+    prompt = f"Based on this user input: {user_input}, extract related information from the following article:\n\n{article_text}\n\n"
+    response = await scheduler.run(lambda: kernel.invoke_prompt(prompt, KernelArguments()), prompt, BATCH, BATCH_TIMEOUT)
     print(f"Summary for {pmcid}:\n{response}\n")
     return str(response)
 
@@ -122,8 +121,9 @@ async def main():
     related_ids = await related_pmcs(user_input, records)
 
     # Summarize each related article
+    summaries = load_summaries(SUMMARY_PATH)
     for pmcid in related_ids:
-        await summarize_article(user_input, pmcid)
+        await summarize_article(user_input, pmcid, summaries)
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
@@ -0,0 +1,219 @@
+import os
+import re
+import csv
+import json
+import zlib
+import numpy as np
+from collections import defaultdict
+from load_publications import load_publication_map, extract_pmc_id
+from fileutils import write_json_atomic
+
+CSV_PATH = 'publications.csv'
+DATA_FOLDER = 'data/SB_publication'
+CANONICAL_PATH = 'canonical_publications.json'
+NUM_PERM = 64
+BANDS = 16  # 16 bands x 4 rows: pairs above ~0.5 Jaccard become candidates
+TITLE_THRESHOLD = 0.95  # titles alone are a weak signal; gene names differ by one word
+DOCUMENT_THRESHOLD = 0.8
+_PRIME = (1 << 31) - 1
+
+def normalize_text(text):
+    return " ".join(re.sub(r'[^\w\s]', ' ', text.lower()).split())
+
+def char_shingles(text, k=5):
+    text = normalize_text(text)
+    if len(text) <= k:
+        return {text} if text else set()
+    return {text[i:i + k] for i in range(len(text) - k + 1)}
+
+def word_shingles(text, k=5):
+    words = normalize_text(text).split()
+    if len(words) <= k:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + k]) for i in range(len(words) - k + 1)}
+
+def jaccard(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+class MinHashLSH:
+    """MinHash signatures bucketed by LSH bands.
+
+    Each item is hashed once into NUM_PERM minimums; items that agree on every
+    row of some band share a bucket and become candidate pairs. Only the
+    candidate pairs get an exact Jaccard check, so clustering stays near-linear
+    in the number of items.
+    """
+
+    def __init__(self, num_perm=NUM_PERM, bands=BANDS, seed=1):
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(1, _PRIME, num_perm, dtype=np.int64)
+        self.b = rng.integers(0, _PRIME, num_perm, dtype=np.int64)
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.buckets = defaultdict(list)
+
+    def signature(self, shingles):
+        hashes = np.array([zlib.crc32(s.encode('utf-8')) for s in shingles], dtype=np.int64)
+        return ((np.outer(self.a, hashes) + self.b[:, None]) % _PRIME).min(axis=1)
+
+    def add(self, key, shingles):
+        if not shingles:
+            return
+        sig = self.signature(shingles)
+        for band in range(self.bands):
+            chunk = sig[band * self.rows:(band + 1) * self.rows]
+            self.buckets[(band, chunk.tobytes())].append(key)
+
+    def candidate_pairs(self):
+        pairs = set()
+        for keys in self.buckets.values():
+            for i in range(len(keys)):
+                for j in range(i + 1, len(keys)):
+                    if keys[i] != keys[j]:
+                        pairs.add((min(keys[i], keys[j]), max(keys[i], keys[j])))
+        return pairs
+
+class UnionFind:
+    def __init__(self):
+        self.parent = {}
+
+    def find(self, x):
+        self.parent.setdefault(x, x)
+        while self.parent[x] != x:
+            self.parent[x] = self.parent[self.parent[x]]
+            x = self.parent[x]
+        return x
+
+    def union(self, x, y):
+        self.parent[self.find(y)] = self.find(x)
+
+def near_duplicates(items, shingle_fn, threshold):
+    """Pairs of keys from {key: text} whose shingle sets are at least `threshold` similar"""
+    shingles = {key: shingle_fn(text) for key, text in items.items()}
+    lsh = MinHashLSH()
+    for key, s in shingles.items():
+        lsh.add(key, s)
+    return [(x, y) for x, y in lsh.candidate_pairs() if jaccard(shingles[x], shingles[y]) >= threshold]
+
+def read_csv_records(csv_path=CSV_PATH):
+    records = []
+    with open(csv_path, newline='', encoding='utf-8-sig') as f:
+        for row in csv.DictReader(f):
+            url = row.get('Link', '').strip()
+            records.append({'title': row.get('Title', '').strip(), 'url': url, 'pmcid': extract_pmc_id(url)})
+    return records
+
+def build_canonical_set(csv_path=CSV_PATH, data_folder=DATA_FOLDER):
+    """Cluster repeated and near-identical CSV entries and BioC documents.
+
+    Returns the report that is written to canonical_publications.json: one
+    entry per canonical PMC ID, the PMC IDs folded into each of them, and the
+    IDs that have no BioC file.
+    """
+    records = [r for r in read_csv_records(csv_path) if r['pmcid']]
+    corpus = {pub['pmcid']: pub for pub in load_publication_map(data_folder).values()}
+
+    uf = UnionFind()
+    by_pmcid = {}
+    for record in records:
+        uf.find(record['pmcid'])  # repeated rows share a PMC ID and collapse here
+        by_pmcid.setdefault(record['pmcid'], []).append(record)
+
+    titles = {pmcid: rows[0]['title'] for pmcid, rows in by_pmcid.items()}
+    for pmcid, pub in corpus.items():
+        titles[pmcid] = pub['title']
+        uf.find(pmcid)
+    documents = {pmcid: f"{pub['title']} {pub['abstract']}" for pmcid, pub in corpus.items() if pub['abstract']}
+    for x, y in near_duplicates(documents, word_shingles, DOCUMENT_THRESHOLD):
+        uf.union(x, y)
+
+    # Similar titles can belong to different studies ("ARG1 functions in ..." vs
+    # "HSFA2 functions in ..."), so titles only decide when a text is missing
+    for x, y in near_duplicates(titles, char_shingles, TITLE_THRESHOLD):
+        if x not in documents or y not in documents:
+            uf.union(x, y)
+
+    clusters = defaultdict(list)
+    order = list(by_pmcid) + [p for p in corpus if p not in by_pmcid]
+    for pmcid in order:
+        clusters[uf.find(pmcid)].append(pmcid)
+
+    publications, duplicate_clusters = [], []
+    for members in clusters.values():
+        # Prefer a member we can actually read, then the first CSV listing
+        canonical = next((p for p in members if p in corpus), members[0])
+        rows = [r for p in members for r in by_pmcid.get(p, [])]
+        csv_titles = sorted({r['title'] for r in rows})
+        publications.append({
+            'pmcid': canonical,
+            'title': corpus[canonical]['title'] if canonical in corpus else titles[canonical],
+            'url': rows[0]['url'] if rows else f"https://www.ncbi.nlm.nih.gov/pmc/articles/{canonical}/",
+            'has_bioc': canonical in corpus,
+            'duplicates': [p for p in members if p != canonical],
+            'csv_titles': csv_titles
+        })
+        if len(members) > 1 or len(rows) > 1:
+            duplicate_clusters.append(members)
+
+    return {
+        'publications': publications,
+        'missing': sorted(p for p in by_pmcid if p not in corpus),
+        'duplicate_clusters': duplicate_clusters,
+        'csv_rows': len(records)
+    }
+
+def save_canonical_set(report, path=CANONICAL_PATH):
+    write_json_atomic(report, path)
+
+def load_canonical_set(path=CANONICAL_PATH):
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"Error loading canonical set from {path}: {e}")
+        return None
+
+def load_duplicate_ids(path=CANONICAL_PATH):
+    """PMC IDs folded into another canonical entry; empty if the job hasn't run"""
+    report = load_canonical_set(path)
+    if not report:
+        return set()
+    return {pmcid for pub in report['publications'] for pmcid in pub['duplicates']}
+
+def canonical_records(records, drop_missing=True, path=CANONICAL_PATH):
+    """Keep one record per canonical PMC ID.
+
+    Records for duplicate IDs are dropped, and so are IDs without a BioC file
+    unless drop_missing is False (fetchers still want to retry those once).
+    """
+    report = load_canonical_set(path)
+    skip = set()
+    if report:
+        skip = {pmcid for pub in report['publications'] for pmcid in pub['duplicates']}
+        if drop_missing:
+            skip.update(report['missing'])
+    seen = set()
+    kept = []
+    for record in records:
+        pmcid = record.get('pmcid')
+        if not pmcid or pmcid in skip or pmcid in seen:
+            continue
+        seen.add(pmcid)
+        kept.append(record)
+    return kept
+
+if __name__ == "__main__":
+    report = build_canonical_set()
+    save_canonical_set(report)
+    folded = sum(len(pub['duplicates']) for pub in report['publications'])
+    print(f"CSV rows: {report['csv_rows']}")
+    print(f"Canonical publications: {len(report['publications'])} ({folded} near-duplicate IDs folded)")
+    print(f"Duplicate clusters: {len(report['duplicate_clusters'])}")
+    print(f"Missing from {DATA_FOLDER}: {len(report['missing'])}")
+    for pmcid in report['missing']:
+        print(f"  {pmcid}")
+    print(f"Saved {CANONICAL_PATH}")
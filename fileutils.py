@@ -0,0 +1,23 @@
+import os
+import json
+from contextlib import contextmanager
+
+@contextmanager
+def atomic_output(path, suffix=''):
+    """Yield a temporary path next to `path`; it replaces `path` only once fully written.
+
+    Readers (and the file watcher) therefore never see a partial file. The
+    suffix keeps writers that append an extension (np.savez) on the same name.
+    """
+    tmp_path = f"{path}.tmp{suffix}"
+    try:
+        yield tmp_path
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def write_json_atomic(data, path):
+    with atomic_output(path) as tmp_path:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2, ensure_ascii=False)
@@ -1,11 +1,21 @@
 import os
+import re
 import json
+import hashlib
 from dotenv import load_dotenv
 import asyncio
+from contextlib import aclosing
 from semantic_kernel import Kernel
 from semantic_kernel.connectors.ai.open_ai import AzureChatCompletion
 from semantic_kernel.functions.kernel_arguments import KernelArguments
-from load_publications import load_all_publications, create_knowledge_base_text
+from load_publications import load_publication_map, update_publication_map, create_knowledge_base_text
+from summary_store import SUMMARY_PATH, load_summaries
+from tracing import span
+from ngram_index import TrigramIndex
+from table_index import TableIndex
+from dedup import CANONICAL_PATH, load_duplicate_ids
+from singleflight import SingleFlight
+from llm_scheduler import scheduler, Overloaded, INTERACTIVE, BATCH, INTERACTIVE_TIMEOUT, BATCH_TIMEOUT
 
 # Load environment variables
 load_dotenv()
@@ -15,13 +25,77 @@ model_id = os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME")
 endpoint = os.getenv("AZURE_OPENAI_ENDPOINT")
 api_key = os.getenv("AZURE_API_KEY")
 
+DATA_FOLDER = 'data/SB_publication'
+KNOWLEDGE_BASE_SIZE = 50  # Use first 50 for context size
+BATCH_CONCURRENCY = int(os.getenv("SEARCH_BATCH_CONCURRENCY", "4"))  # Model calls in flight per batch
+
 # Load publications data
 print("Loading publications...")
-publications = load_all_publications('data/SB_publication')
+corpus = load_publication_map(DATA_FOLDER)
+
+# Near-duplicates folded into another paper by dedup.py stay out of prompts and indexes
+duplicate_ids = load_duplicate_ids(CANONICAL_PATH)
+
+def canonical_publications(corpus_map):
+    return [pub for pub in corpus_map.values() if pub['pmcid'] not in duplicate_ids]
+
+publications = canonical_publications(corpus)
 print(f"Loaded {len(publications)} publications")
 
+# Offline per-paper summaries (see paper_summaries.py) keep the prompt compact
+summaries = load_summaries(SUMMARY_PATH)
+print(f"Loaded {len(summaries)} paper summaries")
+
 # Create knowledge base
-knowledge_base = create_knowledge_base_text(publications[:50])  # Use first 50 for context size
+knowledge_base = create_knowledge_base_text(publications[:KNOWLEDGE_BASE_SIZE], summaries)
+
+# Callbacks notified after the corpus is swapped: fn(publications, loaded, dropped_pmcids)
+corpus_listeners = []
+
+# Typo-tolerant title/abstract index, kept in step with the corpus
+papers_by_pmcid = {pub['pmcid']: pub for pub in publications}
+paper_index = TrigramIndex()
+for pub in publications:
+    paper_index.add(pub['pmcid'], f"{pub['title']}\n{pub['abstract']}")
+
+def swap_publications(new_corpus, loaded, dropped):
+    """Swap in a new corpus and notify listeners.
+
+    The knowledge base is rebuilt only when the papers it is made of changed.
+    Requests keep using the previous objects until the swap, so nothing
+    blocks on a refresh.
+    """
+    global corpus, publications, knowledge_base, papers_by_pmcid
+    new_publications = canonical_publications(new_corpus)
+
+    old_head = [id(p) for p in publications[:KNOWLEDGE_BASE_SIZE]]
+    new_head = [id(p) for p in new_publications[:KNOWLEDGE_BASE_SIZE]]
+    new_knowledge_base = knowledge_base
+    if new_head != old_head:
+        new_knowledge_base = create_knowledge_base_text(new_publications[:KNOWLEDGE_BASE_SIZE], summaries)
+
+    corpus, publications, knowledge_base = new_corpus, new_publications, new_knowledge_base
+    papers_by_pmcid = {pub['pmcid']: pub for pub in new_publications}
+    print(f"Corpus updated: {len(loaded)} loaded, {len(dropped)} removed, {len(publications)} total")
+
+    for listener in corpus_listeners:
+        listener(new_publications, loaded, dropped)
+
+def apply_corpus_changes(changed_paths, removed_paths):
+    """Watcher callback: parse only the changed files and swap in the new corpus"""
+    new_corpus, loaded, dropped = update_publication_map(corpus, changed_paths, removed_paths)
+    loaded = [pub for pub in loaded if pub['pmcid'] not in duplicate_ids]
+    swap_publications(new_corpus, loaded, dropped)
+
+def reload_canonical_set(changed_paths, removed_paths):
+    """Watcher callback: apply a new dedup report to the loaded corpus"""
+    global duplicate_ids
+    new_duplicates = load_duplicate_ids(CANONICAL_PATH)
+    restored, folded = duplicate_ids - new_duplicates, new_duplicates - duplicate_ids
+    duplicate_ids = new_duplicates
+    loaded = [pub for pub in corpus.values() if pub['pmcid'] in restored]
+    dropped = [pub['pmcid'] for pub in corpus.values() if pub['pmcid'] in folded]
+    swap_publications(corpus, loaded, dropped)
 
 # Create kernel
 kernel = Kernel()
@@ -33,19 +107,138 @@ kernel.add_service(
     )
 )
 
-async def search_publications(query):
-    """Search publications using AI"""
-    prompt = f"""You are a NASA bioscience research assistant. Based on the following database of research publications, answer the user's question.
+def update_paper_index(new_publications, loaded, dropped):
+    for pmcid in dropped:
+        paper_index.remove(pmcid)
+    for pub in loaded:
+        paper_index.add(pub['pmcid'], f"{pub['title']}\n{pub['abstract']}")
+
+corpus_listeners.append(update_paper_index)
+
+# Columnar store over table cells plus table/figure captions (see table_index.py)
+table_index = TableIndex(publications)
+print(f"Indexed {len(table_index)} tables")
+
+def update_table_index(new_publications, loaded, dropped):
+    table_index.update(loaded, dropped)
+
+corpus_listeners.append(update_table_index)
+
+def find_papers(query, mode='auto', limit=50):
+    """Look up papers by title/abstract, tolerating typos"""
+    by_pmcid = papers_by_pmcid
+    ids = [pmcid for pmcid in paper_index.search(query, mode) if pmcid in by_pmcid]
+    return [by_pmcid[pmcid] for pmcid in sorted(ids)[:limit]]
+
+def reload_summaries(changed_paths, removed_paths):
+    """Watcher callback: pick up a new summary store and rebuild the knowledge base"""
+    global summaries, knowledge_base
+    new_summaries = load_summaries(SUMMARY_PATH)
+    knowledge_base = create_knowledge_base_text(publications[:KNOWLEDGE_BASE_SIZE], new_summaries)
+    summaries = new_summaries
+    print(f"Reloaded {len(summaries)} paper summaries")
+
+def normalize_query(query):
+    """Case-fold, drop punctuation and collapse whitespace so near-identical queries match"""
+    return " ".join(re.sub(r"[^\w\s]", " ", query.lower()).split())
+
+def build_search_prompt(query, context=None):
+    """Build the search prompt around a knowledge base (the current one by default)"""
+    if context is None:
+        context = knowledge_base
+    return f"""You are a NASA bioscience research assistant. Based on the following database of research publications, answer the user's question.
 
 Database:
-{knowledge_base}
+{context}
 
 User Question: {query}
 
 Provide a concise, accurate answer based only on the information in the database. If the information isn't available, say so. Include relevant paper IDs when referencing specific studies."""
 
-    response = await kernel.invoke_prompt(prompt, KernelArguments())
-    return str(response)
+# Concurrent requests with the same normalized prompt share one model call
+model_flight = SingleFlight()
+
+def prompt_key(prompt, priority=INTERACTIVE):
+    """Flight key for a prompt; the priority is part of it so an interactive
+    caller never waits behind a batch call's queue position and timeout"""
+    return f"{priority}:{hashlib.sha256(normalize_query(prompt).encode('utf-8')).hexdigest()}"
+
+async def invoke_prompt(prompt, priority=INTERACTIVE):
+    """Invoke the model through the scheduler, joining an identical call already in flight"""
+    timeout = INTERACTIVE_TIMEOUT if priority == INTERACTIVE else BATCH_TIMEOUT
+
+    async def call():
+        response = await scheduler.run(lambda: kernel.invoke_prompt(prompt, KernelArguments()), prompt, priority, timeout)
+        return str(response)
+    return await model_flight.do(prompt_key(prompt, priority), call)
+
+async def stream_prompt(prompt):
+    """Stream the model's answer; identical concurrent streams share one call"""
+    async def call():
+        await scheduler.admit(prompt, INTERACTIVE, scheduler.clock() + INTERACTIVE_TIMEOUT)
+        async for update in kernel.invoke_prompt_stream(prompt, arguments=KernelArguments()):
+            text = str(update[0]) if update else ""
+            if text:
+                yield text
+    # aclosing: a client disconnect must reach the flight now, not when the generator is collected
+    async with aclosing(model_flight.stream(prompt_key(prompt), call)) as chunks:
+        async for chunk in chunks:
+            yield chunk
+
+async def search_publications(query):
+    """Search publications using AI"""
+    with span('prompt'):
+        prompt = build_search_prompt(query)
+    with span('model'):
+        return await invoke_prompt(prompt)
+
+async def stream_search_publications(query):
+    """Search publications using AI, yielding the answer as it is generated"""
+    with span('prompt'):
+        prompt = build_search_prompt(query)
+    async with aclosing(stream_prompt(prompt)) as chunks:
+        async for chunk in chunks:
+            yield chunk
+
+async def search_publications_batch(queries, concurrency=BATCH_CONCURRENCY):
+    """Answer many queries at once, yielding one result per query as soon as it is ready.
+
+    Every prompt is built from the same knowledge base snapshot, queries that
+    normalize to the same text share a single model call, and at most
+    `concurrency` calls run at the same time.
+    """
+    context = knowledge_base
+    groups = {}
+    for i, query in enumerate(queries):
+        key = normalize_query(query) if isinstance(query, str) else ''
+        if not key:
+            yield {'index': i, 'query': query, 'error': 'No query provided'}
+            continue
+        groups.setdefault(key, []).append(i)
+
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def answer(indexes):
+        async with semaphore:
+            try:
+                prompt = build_search_prompt(queries[indexes[0]], context)
+                return indexes, {'answer': await invoke_prompt(prompt, BATCH)}
+            except Overloaded as e:
+                return indexes, {'error': str(e), 'retry_after': e.retry_after}
+            except Exception as e:
+                print(f"Error in batch query {queries[indexes[0]]!r}: {e}")
+                return indexes, {'error': str(e)}
+
+    tasks = [asyncio.ensure_future(answer(indexes)) for indexes in groups.values()]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            indexes, result = await next_done
+            for i in indexes:
+                yield {'index': i, 'query': queries[i], 'deduplicated': len(indexes) > 1, **result}
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
 
 # Test function
 async def main():
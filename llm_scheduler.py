@@ -0,0 +1,198 @@
+import os
+import math
+import time
+import heapq
+import random
+import asyncio
+import itertools
+import threading
+
+# Lower runs first
+INTERACTIVE = 0
+BATCH = 1
+
+class Overloaded(Exception):
+    """The request was shed; the caller should retry after `retry_after` seconds"""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = max(1, math.ceil(retry_after))
+
+class TokenBucket:
+    """A budget refilled continuously at `per_minute` units per minute"""
+
+    def __init__(self, per_minute, clock=time.monotonic):
+        self.rate = per_minute / 60.0
+        self.capacity = float(per_minute)
+        self.level = self.capacity
+        self.clock = clock
+        self.updated = clock()
+
+    def _refill(self):
+        now = self.clock()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def available(self):
+        self._refill()
+        return self.level
+
+    def wait_time(self, amount):
+        """Seconds until `amount` is available (0 if it is available now)"""
+        self._refill()
+        amount = min(amount, self.capacity)
+        return max(0.0, (amount - self.level) / self.rate)
+
+    def take(self, amount):
+        self._refill()
+        self.level -= min(amount, self.capacity)
+
+def estimate_tokens(prompt, max_output_tokens=500):
+    """Rough token count for budgeting: ~4 characters per token plus the answer"""
+    return len(prompt) // 4 + max_output_tokens
+
+def is_throttled(error):
+    """True if the error (or anything it wraps) is a provider rate-limit response"""
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        status = getattr(error, 'status_code', None) or getattr(getattr(error, 'response', None), 'status_code', None)
+        if status == 429 or type(error).__name__ == 'RateLimitError':
+            return True
+        error = error.__cause__ or error.__context__
+    return False
+
+class LLMScheduler:
+    """Admission control in front of the model backend.
+
+    Callers queue by priority (interactive before batch, FIFO within a
+    priority) and are admitted when both the requests/min and tokens/min
+    budgets allow. The queue is bounded, and a caller whose deadline cannot be
+    met is shed with Overloaded instead of piling up against the provider.
+    Admitted calls that the provider throttles anyway are retried with
+    exponential backoff and full jitter.
+    """
+
+    def __init__(self, requests_per_minute=60, tokens_per_minute=240000, max_queue=32,
+                 max_retries=3, retry_base_delay=1.0, clock=time.monotonic):
+        self.requests = TokenBucket(requests_per_minute, clock)
+        self.tokens = TokenBucket(tokens_per_minute, clock)
+        self.max_queue = max_queue
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        self.clock = clock
+        self._cond = threading.Condition()
+        self._queue = []
+        self._seq = itertools.count()
+        self.stats = {'admitted': 0, 'shed': 0, 'retried': 0}
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            requests_per_minute=float(os.getenv('LLM_REQUESTS_PER_MINUTE', '60')),
+            tokens_per_minute=float(os.getenv('LLM_TOKENS_PER_MINUTE', '240000')),
+            max_queue=int(os.getenv('LLM_MAX_QUEUE', '32')),
+            max_retries=int(os.getenv('LLM_MAX_RETRIES', '3')),
+            retry_base_delay=float(os.getenv('LLM_RETRY_BASE_DELAY', '1.0'))
+        )
+
+    def _estimated_wait(self, entries):
+        """Rough wait until all of `entries` (queued ahead, plus the caller) can be admitted.
+
+        Whatever the buckets hold right now is spent first; only the shortfall
+        has to be refilled.
+        """
+        tokens = sum(min(t, self.tokens.capacity) for _, _, t in entries)
+        request_wait = max(0.0, len(entries) - self.requests.available()) / self.requests.rate
+        token_wait = max(0.0, tokens - self.tokens.available()) / self.tokens.rate
+        return max(request_wait, token_wait)
+
+    def _ahead_of(self, entry):
+        return [queued for queued in self._queue if queued < entry] + [entry]
+
+    def _shed(self, message, retry_after):
+        self.stats['shed'] += 1
+        raise Overloaded(message, retry_after)
+
+    def acquire(self, priority, tokens, deadline=None, cancelled=None):
+        """Block until admitted; raise Overloaded if the queue is full or the deadline can't be met.
+
+        Returns True once admitted, or False if the `cancelled` event was set
+        first (see abandon); an abandoned caller gives up its place in the
+        queue and spends no budget.
+        """
+        with self._cond:
+            if cancelled is not None and cancelled.is_set():
+                return False
+            entry = (priority, next(self._seq), tokens)
+            if len(self._queue) >= self.max_queue:
+                self._shed('Model queue is full', self._estimated_wait(self._queue + [entry]))
+
+            estimate = self._estimated_wait(self._ahead_of(entry))
+            if deadline is not None and self.clock() + estimate > deadline:
+                self._shed('Model backend is busy', estimate)
+
+            heapq.heappush(self._queue, entry)
+            try:
+                while True:
+                    if cancelled is not None and cancelled.is_set():
+                        return False
+                    wait = None
+                    if self._queue[0] is entry:
+                        wait = max(self.requests.wait_time(1), self.tokens.wait_time(tokens))
+                        if wait == 0:
+                            self.requests.take(1)
+                            self.tokens.take(tokens)
+                            heapq.heappop(self._queue)
+                            self.stats['admitted'] += 1
+                            return True
+                    if deadline is not None:
+                        remaining = deadline - self.clock()
+                        if remaining <= 0 or (wait is not None and wait > remaining):
+                            self._shed('Model backend is busy', wait if wait is not None else self._estimated_wait(self._ahead_of(entry)))
+                        wait = remaining if wait is None else min(wait, remaining)
+                    self._cond.wait(wait)
+            finally:
+                if entry in self._queue:  # shed or interrupted while queued
+                    self._queue.remove(entry)
+                    heapq.heapify(self._queue)
+                self._cond.notify_all()
+
+    def abandon(self, cancelled):
+        """Wake the waiter holding the `cancelled` event so it leaves the queue"""
+        with self._cond:
+            cancelled.set()
+            self._cond.notify_all()
+
+    async def admit(self, prompt, priority=INTERACTIVE, deadline=None):
+        """Wait (off the event loop) until a call for this prompt may start"""
+        loop = asyncio.get_running_loop()
+        cancelled = threading.Event()
+        try:
+            await loop.run_in_executor(None, self.acquire, priority, estimate_tokens(prompt), deadline, cancelled)
+        except asyncio.CancelledError:
+            # Cancelling the await doesn't stop the executor thread; tell it to give up its slot
+            self.abandon(cancelled)
+            raise
+
+    async def run(self, call, prompt, priority=INTERACTIVE, timeout=None):
+        """Admit and await call(), retrying with jittered backoff when the provider throttles"""
+        deadline = self.clock() + timeout if timeout else None
+        for attempt in range(self.max_retries + 1):
+            await self.admit(prompt, priority, deadline)
+            try:
+                return await call()
+            except Exception as e:
+                if not is_throttled(e) or attempt == self.max_retries:
+                    raise
+                delay = random.uniform(0, self.retry_base_delay * 2 ** attempt)
+                if deadline is not None and self.clock() + delay > deadline:
+                    raise Overloaded('Model provider is throttling requests', delay) from e
+                self.stats['retried'] += 1
+                print(f"Model call throttled, retrying in {delay:.1f}s (attempt {attempt + 1}/{self.max_retries})")
+                await asyncio.sleep(delay)
+
+# Shared by every model caller in the process
+scheduler = LLMScheduler.from_env()
+INTERACTIVE_TIMEOUT = float(os.getenv('LLM_QUEUE_TIMEOUT', '30'))
+BATCH_TIMEOUT = float(os.getenv('LLM_BATCH_TIMEOUT', '300'))
@@ -1,58 +1,137 @@
 import os
+import re
 import json
+from summary_store import content_hash, get_summary, format_summary
+from table_index import extract_tables
 
-def load_all_publications(data_folder='data'):
-    """Load all JSON files from the data folder and extract key information"""
-    publications = []
+# Tables and figure captions are extracted into their own structures (see
+# table_index.py) instead of crowding the prose out of the content blob
+STRUCTURED_SECTIONS = ('TABLE', 'FIG')
+
+def extract_pmc_id(url):
+    """The PMC ID in an article URL such as https://www.ncbi.nlm.nih.gov/pmc/articles/PMC11353732/"""
+    match = re.search(r'PMC\d+', url or '')
+    return match.group(0) if match else None
+
+def normalize_pmcid(doc_id):
+    """'PMC123', 'pmc123' and '123' all become 'PMC123'; BioC ids come with and without the prefix"""
+    doc_id = str(doc_id).strip()
+    return f"PMC{doc_id[3:] if doc_id.upper().startswith('PMC') else doc_id}"
+
+def load_publication(filepath):
+    """Load a single BioC JSON file and extract key information"""
+    filename = os.path.basename(filepath)
+    with open(filepath, 'rb') as f:
+        raw = f.read()
+    data = json.loads(raw)
+
+    # Extract from BioC format
+    if not (isinstance(data, list) and len(data) > 0):
+        return None
+
+    doc = data[0].get('documents', [{}])[0]
+    passages = doc.get('passages', [])
+
+    title = ""
+    abstract = ""
+    full_text = ""
+
+    for passage in passages:
+        section = passage.get('infons', {}).get('section_type', '')
+        text = passage.get('text', '')
+
+        if section == 'TITLE':
+            title = text
+        elif section == 'ABSTRACT':
+            abstract = text
+
+        if section not in STRUCTURED_SECTIONS:
+            full_text += text + " "
+
+    if not title:  # Only keep if we found content
+        return None
+
+    doc_id = doc.get('id', filename)
+    tables, figures = extract_tables(passages)
+    return {
+        'id': doc_id,
+        'pmcid': normalize_pmcid(doc_id),
+        'title': title,
+        'abstract': abstract,
+        'content': full_text[:5000],  # Limit for AI context
+        'tables': tables,
+        'figures': figures,
+        'hash': content_hash(raw)
+    }
+
+def load_publication_map(data_folder='data'):
+    """Load all JSON files from the data folder, keyed by file path"""
+    corpus = {}
     
     for filename in os.listdir(data_folder):
         if filename.endswith('.json'):
             filepath = os.path.join(data_folder, filename)
             try:
-                with open(filepath, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    
-                    # Extract from BioC format
-                    if isinstance(data, list) and len(data) > 0:
-                        doc = data[0].get('documents', [{}])[0]
-                        passages = doc.get('passages', [])
-                        
-                        title = ""
-                        abstract = ""
-                        full_text = ""
-                        
-                        for passage in passages:
-                            section = passage.get('infons', {}).get('section_type', '')
-                            text = passage.get('text', '')
-                            
-                            if section == 'TITLE':
-                                title = text
-                            elif section == 'ABSTRACT':
-                                abstract = text
-                            
-                            full_text += text + " "
-                        
-                        if title:  # Only add if we found content
-                            publications.append({
-                                'id': doc.get('id', filename),
-                                'title': title,
-                                'abstract': abstract,
-                                'content': full_text[:5000]  # Limit for AI context
-                            })
-                            
+                pub = load_publication(filepath)
+                if pub:
+                    corpus[filepath] = pub
             except Exception as e:
                 print(f"Error loading {filename}: {e}")
     
-    return publications
+    return corpus
+
+def load_all_publications(data_folder='data'):
+    """Load all JSON files from the data folder and extract key information"""
+    return list(load_publication_map(data_folder).values())
+
+def update_publication_map(corpus, changed_paths, removed_paths):
+    """Apply file deltas to a corpus map without mutating it.
+
+    Only the changed files are parsed. Returns the new map, the publications
+    that were (re)loaded and the PMC IDs of the publications that were dropped.
+    """
+    updated = dict(corpus)
+    loaded = []
+    dropped = []
+
+    for filepath in removed_paths:
+        pub = updated.pop(filepath, None)
+        if pub:
+            dropped.append(pub['pmcid'])
+
+    for filepath in changed_paths:
+        try:
+            pub = load_publication(filepath)
+        except Exception as e:
+            print(f"Error loading {os.path.basename(filepath)}: {e}")
+            continue
+        if pub:
+            updated[filepath] = pub  # keeps the file's position in the map
+            loaded.append(pub)
+        else:
+            previous = updated.pop(filepath, None)
+            if previous:
+                dropped.append(previous['pmcid'])
+
+    return updated, loaded, dropped
+
+def create_knowledge_base_text(publications, summaries=None):
+    """Create a formatted text for AI context
 
-def create_knowledge_base_text(publications):
-    """Create a formatted text for AI context"""
+    Papers with an up-to-date entry in the offline summary store are described
+    by that compact summary instead of their full abstract.
+    """
     knowledge_text = "NASA Space Bioscience Publications Database:\n\n"
+    summaries = summaries or {}
     
     for pub in publications:
         knowledge_text += f"Paper ID: {pub['id']}\n"
         knowledge_text += f"Title: {pub['title']}\n"
-        knowledge_text += f"Abstract: {pub['abstract']}\n"
+        summary = get_summary(summaries, pub['pmcid'], pub.get('hash'))
+        if summary:
+            knowledge_text += format_summary(summary) + "\n"
+        else:
+            knowledge_text += f"Abstract: {pub['abstract']}\n"
         knowledge_text += "-" * 80 + "\n\n"
     
-    return knowledge_text
\ No newline at end of file
+    return knowledge_text
@@ -1,10 +1,19 @@
 import json
+import os
 from pathlib import Path
+import numpy as np
 import pandas as pd
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, request, jsonify, send_from_directory, stream_with_context
 from flask_cors import CORS
 import asyncio
-from kernel import search_publications
+import hmac
+import kernel
+from llm_scheduler import Overloaded
+from kernel import search_publications, stream_search_publications, search_publications_batch, find_papers
+from watcher import FileWatcher
+from trends import TrendsIndex, to_arrow
+from similar_papers import SIMILAR_PATH, SimilarPapers
+from tracing import start_trace, span, finish_trace, server_timing, log_trace, sample_profile
 import traceback
 
 app = Flask(__name__, static_folder='.')
@@ -12,16 +21,71 @@ CORS(app, resources={r"/*": {"origins": "*", "methods": ["GET", "POST", "OPTIONS
 
 # Load trends data
 DATA_PATH = Path(__file__).parent / 'json1_all_rows.json'
+MAX_BATCH_QUERIES = int(os.getenv('MAX_BATCH_QUERIES', '50'))
+PROFILER_TOKEN = os.getenv('PROFILER_TOKEN', '')  # /api/debug/profile is disabled unless set
+MAX_PROFILE_SECONDS = 60
 df = pd.DataFrame()
 
+def load_trends_data(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        raw = json.load(f)
+    return pd.DataFrame(raw)
+
 try:
     if DATA_PATH.exists():
-        with open(DATA_PATH, 'r', encoding='utf-8') as f:
-            raw = json.load(f)
-        df = pd.DataFrame(raw)
+        df = load_trends_data(DATA_PATH)
         print(f"Loaded {len(df)} records for trends")
 except Exception as e:
     print(f"ERROR loading trends data: {e}")
+trends_index = TrendsIndex(df)
+
+# Precomputed by `python similar_papers.py`
+similar_table = SimilarPapers.load(SIMILAR_PATH)
+print(f"Loaded similar-paper table for {len(similar_table)} papers")
+
+def reload_trends_data(changed_paths, removed_paths):
+    """Watcher callback: parse the new file off the request path, then swap"""
+    global df, trends_index
+    if removed_paths and not changed_paths:
+        df, trends_index = pd.DataFrame(), TrendsIndex(pd.DataFrame())
+        print("Trends data removed")
+        return
+    try:
+        new_df = load_trends_data(DATA_PATH)
+        new_index = TrendsIndex(new_df)
+    except Exception as e:
+        print(f"ERROR reloading trends data: {e}")  # keep serving the previous data
+        return
+    df, trends_index = new_df, new_index
+    print(f"Reloaded {len(df)} records for trends")
+
+def reload_similar_table(changed_paths, removed_paths):
+    global similar_table
+    similar_table = SimilarPapers.load(SIMILAR_PATH)
+    print(f"Reloaded similar-paper table for {len(similar_table)} papers")
+
+def start_watchers():
+    watcher = FileWatcher(interval=float(os.getenv('WATCH_INTERVAL', '2')))
+    watcher.watch_folder(kernel.DATA_FOLDER, kernel.apply_corpus_changes)
+    watcher.watch_file(DATA_PATH, reload_trends_data)
+    watcher.watch_file(kernel.SUMMARY_PATH, kernel.reload_summaries)
+    watcher.watch_file(SIMILAR_PATH, reload_similar_table)
+    watcher.watch_file(kernel.CANONICAL_PATH, kernel.reload_canonical_set)
+    return watcher.start()
+
+def iterate_async(agen):
+    """Drive an async generator from a sync (WSGI) generator on a private event loop"""
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        while True:
+            try:
+                yield loop.run_until_complete(agen.__anext__())
+            except StopAsyncIteration:
+                break
+    finally:
+        loop.run_until_complete(agen.aclose())
+        loop.close()
 
 # ===== MANAGER ENDPOINTS =====
 @app.route('/api/search', methods=['POST', 'OPTIONS'])
@@ -29,11 +93,26 @@ def search():
     if request.method == 'OPTIONS':
         return '', 204
     try:
-        data = request.json
+        with span('parse'):
+            data = request.json
         query = data.get('query', '')
         if not query:
             return jsonify({'error': 'No query provided'}), 400
         
+        if data.get('stream'):
+            chunks = iterate_async(stream_search_publications(query))
+            first = next(chunks, '')  # admission happens here, so a shed request still gets a 429
+
+            def generate():
+                yield first
+                try:
+                    yield from chunks
+                except Exception as e:
+                    print(f"Error in streamed search: {e}")
+                    traceback.print_exc()
+                    yield f"\n[Server error: {str(e)}]"
+            return Response(stream_with_context(generate()), mimetype='text/plain')
+        
         loop = asyncio.new_event_loop()
         asyncio.set_event_loop(loop)
         try:
@@ -41,79 +120,199 @@ def search():
         finally:
             loop.close()
         
-        return jsonify({'answer': result})
+        with span('serialize'):
+            return jsonify({'answer': result})
+    except Overloaded as e:
+        return jsonify({'error': str(e), 'retry_after': e.retry_after}), 429, {'Retry-After': str(e.retry_after)}
     except Exception as e:
         print(f"Error in search: {e}")
         traceback.print_exc()
         return jsonify({'error': f'Server error: {str(e)}'}), 500
 
+@app.route('/api/search/batch', methods=['POST', 'OPTIONS'])
+def search_batch():
+    """Answer a list of queries, streaming one JSON line per query as it completes"""
+    if request.method == 'OPTIONS':
+        return '', 204
+    with span('parse'):
+        data = request.get_json(silent=True) or {}
+    queries = data.get('queries')
+    if not isinstance(queries, list) or not queries:
+        return jsonify({'error': 'No queries provided'}), 400
+    if len(queries) > MAX_BATCH_QUERIES:
+        return jsonify({'error': f'Too many queries (max {MAX_BATCH_QUERIES})'}), 400
+
+    def generate():
+        try:
+            for item in iterate_async(search_publications_batch(queries)):
+                yield json.dumps(item) + '\n'
+        except Exception as e:
+            print(f"Error in batch search: {e}")
+            traceback.print_exc()
+            yield json.dumps({'error': f'Server error: {str(e)}'}) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+# ===== SCIENTIST ENDPOINTS =====
+@app.route('/api/papers/search')
+def papers_search():
+    """Typo-tolerant paper lookup: ?q=...&mode=auto|phrase|prefix|fuzzy&limit=N"""
+    query = request.args.get('q', '')
+    mode = request.args.get('mode', 'auto')
+    if not query:
+        return jsonify({'error': 'No query provided'}), 400
+    try:
+        limit = int(request.args.get('limit', 50))
+        papers = find_papers(query, mode=mode, limit=limit)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    with span('serialize'):
+        return jsonify({
+            'query': query,
+            'mode': mode,
+            'results': [{'id': p['pmcid'], 'title': p['title'], 'abstract': p['abstract']} for p in papers]
+        })
+
+@app.route('/api/papers/<pmc_id>/similar')
+def papers_similar(pmc_id):
+    """Nearest neighbors of a paper from the precomputed table"""
+    try:
+        k = int(request.args.get('k', 10))
+    except ValueError:
+        return jsonify({'error': 'Invalid k'}), 400
+    if k < 1:
+        return jsonify({'error': 'k must be at least 1'}), 400
+    neighbors = similar_table.similar(pmc_id, k)
+    if neighbors is None:
+        return jsonify({'error': f'Unknown paper: {pmc_id}'}), 404
+    papers = kernel.papers_by_pmcid
+    return jsonify({
+        'id': pmc_id,
+        'similar': [{'id': pmcid, 'title': papers[pmcid]['title'] if pmcid in papers else '', 'score': round(score, 4)}
+                    for pmcid, score in neighbors]
+    })
+
+@app.route('/api/tables/query', methods=['POST', 'OPTIONS'])
+def tables_query():
+    """Rows of extracted paper tables: {"where": ["duration > 30 days", "organism = mouse"], "caption": "...", "limit": N}"""
+    if request.method == 'OPTIONS':
+        return '', 204
+    with span('parse'):
+        payload = request.get_json(silent=True) or {}
+    try:
+        limit = int(payload.get('limit', 50))
+        with span('query'):
+            result = kernel.table_index.query(payload.get('where') or [], caption=payload.get('caption'), limit=limit)
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    with span('serialize'):
+        return jsonify(result)
+
+@app.route('/api/captions/search')
+def captions_search():
+    """Table and figure captions: ?q=...&kind=table|figure&mode=auto|phrase|prefix|fuzzy&limit=N"""
+    query = request.args.get('q', '')
+    if not query:
+        return jsonify({'error': 'No query provided'}), 400
+    try:
+        limit = int(request.args.get('limit', 50))
+        results = kernel.table_index.search_captions(query, mode=request.args.get('mode', 'auto'),
+                                                     kind=request.args.get('kind'), limit=limit)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    with span('serialize'):
+        return jsonify({'query': query, 'results': results})
+
 # ===== TRENDS ENDPOINTS =====
 @app.route('/api/trends', methods=['POST', 'OPTIONS'])
 def api_trends():
     if request.method == 'OPTIONS':
         return '', 204
     try:
-        payload = request.get_json() or {}
+        with span('parse'):
+            payload = request.get_json() or {}
         divisions = payload.get('divisions', [])
         keyword = payload.get('keyword', '')
         
         result = build_series_for_divisions(divisions, keyword=keyword)
         result['requested'] = {'divisions': divisions, 'keyword': keyword}
-        return jsonify(result)
+        with span('serialize'):
+            return jsonify(result)
     except Exception as e:
         print(f"Error in trends: {e}")
         traceback.print_exc()
         return jsonify({'error': str(e)}), 500
 
 def build_series_for_divisions(divisions_list, keyword=None):
-    # [Copy the function from plot.py here - same code]
-    if df.empty:
+    index = trends_index  # snapshot, the watcher may swap it mid-request
+    if index.n == 0:
         return {'years': [], 'series': [], 'total': 0}
     
-    year_col = next((c for c in ['Fiscal Year', 'Year'] if c in df.columns), None)
+    year_col = next((c for c in ['Fiscal Year', 'Year'] if c in index.df.columns), None)
     if not year_col:
         return {'years': [], 'series': [], 'total': 0}
     
     keywords = [k.strip() for k in (keyword.split(',') if keyword else [])] if keyword else []
     if not divisions_list:
-        divisions_list = sorted(df['Division'].dropna().unique().tolist())
-    
-    years_set, series = set(), []
+        divisions_list = index.codes('Division')[1]
     
-    def get_counts_by_year(subset_df):
-        ys = pd.to_numeric(subset_df[year_col], errors='coerce').dropna().astype(int)
-        return ys.value_counts().to_dict()
+    year_codes, year_labels = index.bucket_codes('year')
+    series = []
     
-    for div in divisions_list:
-        mask = df['Division'].apply(lambda v: isinstance(v, str) and div.lower() in v.lower())
-        subset = df[mask]
-        if len(subset) == 0:
-            continue
-        counts_map = get_counts_by_year(subset)
-        years_set.update(counts_map.keys())
-        series.append({'name': div, 'counts_map': counts_map, 'total': len(subset)})
+    with span('divisions'):
+        for div in divisions_list:
+            mask = index.match_mask('Division', [div])
+            total = int(mask.sum())
+            if total == 0:
+                continue
+            series.append({'name': div, 'counts': index.count(mask, year_codes, len(year_labels)), 'total': total})
     
-    if keywords:
+    with span('keywords'):
+        in_divisions = index.match_mask('Division', divisions_list)
         for kw in keywords:
-            kw_lower = kw.lower()
-            subset_all = df if not divisions_list else df[df['Division'].apply(
-                lambda v: isinstance(v, str) and any(d.lower() in v.lower() for d in divisions_list))]
-            subset_kw = subset_all[subset_all.apply(
-                lambda r: kw_lower in str(r.get('Project Title', '')).lower() or 
-                         kw_lower in str(r.get('Task Abstract/Description', '')).lower(), axis=1)]
-            if len(subset_kw) > 0:
-                counts_map = get_counts_by_year(subset_kw)
-                years_set.update(counts_map.keys())
-                series.append({'name': f'"{kw}"', 'counts_map': counts_map, 'total': len(subset_kw)})
+            mask = in_divisions & index.keyword_mask(kw)
+            total = int(mask.sum())
+            if total > 0:
+                series.append({'name': f'"{kw}"', 'counts': index.count(mask, year_codes, len(year_labels)), 'total': total})
     
-    years = sorted(list(years_set))
-    years_str = [str(int(y)) for y in years]
+    used = np.zeros(len(year_labels), dtype=bool)
     for s in series:
-        counts_map = s.pop('counts_map', {})
-        s['counts'] = [int(counts_map.get(int(y), 0)) for y in years]
+        used |= s['counts'] > 0
+    years_str = [label for label, u in zip(year_labels, used) if u]
+    for s in series:
+        s['counts'] = [int(c) for c in s['counts'][used]]
     
     return {'years': years_str, 'series': series, 'total': sum(s.get('total', 0) for s in series), 'year_col': year_col}
 
+@app.route('/api/trends/query', methods=['POST', 'OPTIONS'])
+def api_trends_query():
+    """Generalized trends: any time bucket, any categorical group-by, optional share normalization"""
+    if request.method == 'OPTIONS':
+        return '', 204
+    try:
+        with span('parse'):
+            payload = request.get_json(silent=True) or {}
+        with span('query'):
+            result = trends_index.query(
+                bucket=payload.get('bucket', 'year'),
+                group_by=payload.get('group_by'),
+                groups=payload.get('groups'),
+                filters=payload.get('filters'),
+                keywords=payload.get('keywords'),
+                normalize=payload.get('normalize'),
+                top=payload.get('top')
+            )
+        with span('serialize'):
+            if payload.get('format') == 'arrow':
+                return Response(to_arrow(result), mimetype='application/vnd.apache.arrow.stream')
+            return jsonify(result)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        print(f"Error in trends query: {e}")
+        traceback.print_exc()
+        return jsonify({'error': str(e)}), 500
+
 # ===== HTML PAGES =====
 @app.route('/')
 def index():
@@ -144,10 +343,38 @@ def serve_file(path):
 
 @app.route('/api/health')
 def health():
-    return jsonify({'status': 'ok', 'manager': True, 'trends': True, 'records': len(df)})
+    return jsonify({'status': 'ok', 'manager': True, 'trends': True, 'records': len(df), 'publications': len(kernel.publications),
+                    'model_calls': dict(kernel.model_flight.stats), 'scheduler': dict(kernel.scheduler.stats),
+                    'tables': kernel.table_index.stats()})
+
+# ===== DIAGNOSTICS =====
+@app.route('/api/debug/profile')
+def debug_profile():
+    """Sample all server threads for ?seconds=N and return collapsed stacks for a flamegraph"""
+    token = request.headers.get('X-Profiler-Token', '')
+    if not PROFILER_TOKEN or not hmac.compare_digest(token, PROFILER_TOKEN):
+        return jsonify({'error': 'File not found'}), 404
+    try:
+        seconds = max(0.0, min(float(request.args.get('seconds', 10)), MAX_PROFILE_SECONDS))
+    except ValueError:
+        return jsonify({'error': 'Invalid seconds'}), 400
+    profile = sample_profile(seconds)
+    if profile is None:
+        return jsonify({'error': 'A profile is already running'}), 409
+    return Response(profile, mimetype='text/plain')
+
+@app.before_request
+def before_request():
+    if request.path.startswith('/api/') and request.method != 'OPTIONS':
+        start_trace(f"{request.method} {request.path}")
 
 @app.after_request
 def after_request(response):
+    trace = finish_trace()
+    if trace is not None:
+        response.headers['Server-Timing'] = server_timing(trace)
+        log_trace(trace, status=response.status_code)
+    response.headers.add('Timing-Allow-Origin', '*')
     response.headers.add('Access-Control-Allow-Origin', '*')
     response.headers.add('Access-Control-Allow-Headers', 'Content-Type')
     response.headers.add('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
@@ -162,4 +389,6 @@ if __name__ == '__main__':
     print(f"Home: http://localhost:5000/")
     print(f"Records loaded: {len(df)}")
     print("=" * 60)
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':  # only in the reloader's serving process
+        start_watchers()
     app.run(host='127.0.0.1', port=5000, debug=True)
\ No newline at end of file
@@ -0,0 +1,180 @@
+import re
+import threading
+from collections import Counter
+
+WORD_RE = re.compile(r'\w+')
+
+def tokenize(text):
+    return WORD_RE.findall(text.lower())
+
+def word_trigrams(word, pad_end=True):
+    """Character trigrams of a word padded with '$' so edges are indexed too"""
+    padded = f"${word}$" if pad_end else f"${word}"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def default_max_edits(term):
+    if len(term) <= 3:
+        return 0
+    if len(term) <= 7:
+        return 1
+    return 2
+
+def edit_distance(a, b, limit):
+    """Levenshtein distance, or limit + 1 as soon as it is known to exceed limit"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+class TrigramIndex:
+    """Typo-tolerant text index: word postings plus a trigram index over the vocabulary.
+
+    Documents are tokenized into words, and each word maps to the documents
+    containing it. A second map from character trigram to vocabulary words
+    finds candidate words for fuzzy and prefix lookups by counting shared
+    trigrams. Edit distance is only computed for those candidates, and
+    documents are found by intersecting word postings, so lookups never scan
+    the full text.
+
+    Safe to update from one thread while others search.
+    """
+
+    def __init__(self):
+        self.texts = {}     # doc id -> normalized text, for phrase verification
+        self.words = {}     # doc id -> set of words in the doc
+        self.postings = {}  # word -> set of doc ids
+        self.grams = {}     # trigram -> set of words
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.texts)
+
+    def add(self, doc_id, text):
+        """Index (or re-index) a document"""
+        tokens = tokenize(text)
+        with self._lock:
+            if doc_id in self.texts:
+                self.remove(doc_id)
+            self.texts[doc_id] = " ".join(tokens)
+            self.words[doc_id] = set(tokens)
+            for word in self.words[doc_id]:
+                docs = self.postings.get(word)
+                if docs is None:
+                    docs = self.postings[word] = set()
+                    for gram in word_trigrams(word):
+                        self.grams.setdefault(gram, set()).add(word)
+                docs.add(doc_id)
+
+    def remove(self, doc_id):
+        """Drop a document; words no longer used anywhere leave the vocabulary"""
+        with self._lock:
+            self.texts.pop(doc_id, None)
+            for word in self.words.pop(doc_id, ()):
+                docs = self.postings[word]
+                docs.discard(doc_id)
+                if not docs:
+                    del self.postings[word]
+                    for gram in word_trigrams(word):
+                        self.grams[gram].discard(word)
+                        if not self.grams[gram]:
+                            del self.grams[gram]
+
+    def prefix_words(self, prefix):
+        """Vocabulary words starting with prefix"""
+        grams = word_trigrams(prefix, pad_end=False)
+        if not grams:  # single character: too short for a trigram
+            return [w for w in self.postings if w.startswith(prefix)]
+        candidates = min((self.grams.get(g, set()) for g in grams), key=len)
+        return [w for w in candidates if w.startswith(prefix)]
+
+    def substring_words(self, fragment):
+        """Vocabulary words containing fragment anywhere"""
+        grams = {fragment[i:i + 3] for i in range(len(fragment) - 2)}
+        if not grams:  # shorter than a trigram
+            return [w for w in self.postings if fragment in w]
+        candidates = self._intersect([self.grams.get(g, set()) for g in grams])
+        return [w for w in candidates if fragment in w]
+
+    def substring_candidates(self, query):
+        """Documents that may contain query as a raw substring, or None if it has no word characters.
+
+        Every word of the query lies inside some word of a matching text, so
+        this is a superset; callers verify against the text they hold.
+        """
+        tokens = tokenize(query)
+        if not tokens:
+            return None
+        with self._lock:
+            return self._intersect([self._docs_for_words(self.substring_words(t)) for t in tokens])
+
+    def fuzzy_words(self, term, max_edits=None):
+        """Vocabulary words within max_edits of term.
+
+        A word within k edits of the term shares at least
+        len(trigrams(term)) - 3k trigrams with it, which bounds the candidates.
+        """
+        if max_edits is None:
+            max_edits = default_max_edits(term)
+        if term in self.postings and max_edits == 0:
+            return [term]
+        grams = word_trigrams(term)
+        threshold = len(grams) - 3 * max_edits
+        if threshold <= 0:
+            candidates = self.postings.keys()
+        else:
+            shared = Counter()
+            for gram in grams:
+                shared.update(self.grams.get(gram, ()))
+            candidates = [w for w, n in shared.items() if n >= threshold]
+        return [w for w in candidates if edit_distance(term, w, max_edits) <= max_edits]
+
+    def _docs_for_words(self, words):
+        docs = set()
+        for word in words:
+            docs |= self.postings.get(word, set())
+        return docs
+
+    def _intersect(self, doc_sets):
+        if not doc_sets:
+            return set()
+        doc_sets = sorted(doc_sets, key=len)
+        result = set(doc_sets[0])
+        for docs in doc_sets[1:]:
+            result &= docs
+            if not result:
+                break
+        return result
+
+    def search(self, query, mode='auto', max_edits=None):
+        """Return the ids of documents matching query.
+
+        mode -- 'phrase': the words in order, the last one as a prefix
+                'prefix': every word as a prefix, in any order
+                'fuzzy':  every word within max_edits typos, in any order
+                'auto':   phrase, falling back to fuzzy when nothing matches
+        """
+        tokens = tokenize(query)
+        if not tokens:
+            return set()
+        with self._lock:
+            if mode in ('phrase', 'auto'):
+                doc_sets = [self.postings.get(t, set()) for t in tokens[:-1]]
+                doc_sets.append(self._docs_for_words(self.prefix_words(tokens[-1])))
+                phrase = " ".join(tokens)
+                result = {d for d in self._intersect(doc_sets)
+                          if f" {phrase}" in f" {self.texts[d]}"}
+                if result or mode == 'phrase':
+                    return result
+                mode = 'fuzzy'
+            if mode == 'prefix':
+                return self._intersect([self._docs_for_words(self.prefix_words(t)) for t in tokens])
+            if mode == 'fuzzy':
+                return self._intersect([self._docs_for_words(self.fuzzy_words(t, max_edits)) for t in tokens])
+        raise ValueError(f"Unknown search mode: {mode}")
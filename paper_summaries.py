@@ -0,0 +1,116 @@
+import os
+import json
+import asyncio
+from dotenv import load_dotenv
+from semantic_kernel import Kernel
+from semantic_kernel.connectors.ai.open_ai import AzureChatCompletion
+from semantic_kernel.functions.kernel_arguments import KernelArguments
+from llm_scheduler import scheduler, BATCH, BATCH_TIMEOUT
+from dedup import load_duplicate_ids
+from summary_store import SUMMARY_PATH, SUMMARY_FIELDS, content_hash, load_summaries, save_summaries, get_summary
+
+DATA_FOLDER = 'data/SB_publication'
+SKIP_SECTIONS = {'REF', 'AUTH_CONT', 'COMP_INT', 'ACK_FUND', 'ABBR', 'REVIEW_INFO'}
+MAX_ARTICLE_CHARS = 60000  # Keep the offline prompt inside the model context
+
+def article_text(data):
+    """Concatenate the BioC passages worth summarizing"""
+    text = ""
+    articles = data if isinstance(data, list) else [data]
+    for article in articles:
+        for doc in article.get('documents', []):
+            for passage in doc.get('passages', []):
+                if passage.get('infons', {}).get('section_type', '') in SKIP_SECTIONS:
+                    continue
+                passage_text = passage.get('text', '')
+                if passage_text:
+                    text += passage_text + "\n"
+    return text[:MAX_ARTICLE_CHARS]
+
+def parse_summary(response):
+    """Parse the model's JSON answer, tolerating code fences and free text"""
+    text = response.strip()
+    if text.startswith('```'):
+        text = text.strip('`')
+        if text.startswith('json'):
+            text = text[4:]
+    try:
+        parsed = json.loads(text)
+    except json.JSONDecodeError:
+        return {'findings': response.strip(), 'organism': '', 'conditions': '', 'endpoints': ''}
+    return {field: str(parsed.get(field, '')) for field in SUMMARY_FIELDS}
+
+def create_kernel():
+    """Build a kernel for the offline job; SUMMARY_MODEL_ENDPOINT can point it at a local stub"""
+    load_dotenv()
+    kernel = Kernel()
+    kernel.add_service(
+        AzureChatCompletion(
+            deployment_name=os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME"),
+            endpoint=os.getenv("SUMMARY_MODEL_ENDPOINT") or os.getenv("AZURE_OPENAI_ENDPOINT"),
+            api_key=os.getenv("AZURE_API_KEY")
+        )
+    )
+    return kernel
+
+async def summarize_paper(kernel, text):
+    prompt = (
+        "Summarize this NASA space bioscience article as a JSON object with the keys "
+        "\"findings\" (key results, 2-3 sentences), \"organism\", \"conditions\" "
+        "(spaceflight or analog conditions) and \"endpoints\" (what was measured). "
+        "Answer with the JSON object only.\n\n"
+        f"{text}"
+    )
+    response = await scheduler.run(lambda: kernel.invoke_prompt(prompt, KernelArguments()), prompt, BATCH, BATCH_TIMEOUT)
+    return parse_summary(str(response))
+
+async def build_summaries(data_folder=DATA_FOLDER, path=SUMMARY_PATH, concurrency=8, kernel=None, skip=()):
+    """Summarize every paper whose content changed since the last run, except PMC IDs in skip"""
+    summaries = load_summaries(path)
+    pending = []
+    for filename in sorted(os.listdir(data_folder)):
+        pmcid = filename[:-len('.json')]
+        if not filename.endswith('.json') or pmcid in skip:
+            continue
+        filepath = os.path.join(data_folder, filename)
+        with open(filepath, 'rb') as f:
+            raw = f.read()
+        digest = content_hash(raw)
+        if not get_summary(summaries, pmcid, digest):
+            pending.append((pmcid, digest, raw))
+
+    print(f"{len(pending)} papers to summarize, {len(summaries)} already stored")
+    if not pending:
+        return summaries
+
+    kernel = kernel or create_kernel()
+    semaphore = asyncio.Semaphore(concurrency)
+    done = 0
+
+    async def run(pmcid, digest, raw):
+        nonlocal done
+        async with semaphore:
+            try:
+                text = article_text(json.loads(raw))
+                if not text:
+                    return
+                entry = await summarize_paper(kernel, text)
+            except Exception as e:
+                print(f"Error summarizing {pmcid}: {e}")
+                return
+        summaries[pmcid] = {'hash': digest, **entry}
+        done += 1
+        if done % 25 == 0:
+            save_summaries(summaries, path)  # checkpoint so an interrupted run can resume
+            print(f"Summarized {done}/{len(pending)}")
+
+    await asyncio.gather(*(run(*item) for item in pending))
+    save_summaries(summaries, path)
+    print(f"Summarized {done}/{len(pending)}, saved to {path}")
+    return summaries
+
+if __name__ == "__main__":
+    asyncio.run(build_summaries(
+        concurrency=int(os.getenv("SUMMARY_CONCURRENCY", "8")),
+        skip=load_duplicate_ids()
+    ))
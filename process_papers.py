@@ -2,10 +2,13 @@ import csv
 import requests
 import json
 import time
-import re
+from dedup import load_duplicate_ids
+from load_publications import extract_pmc_id
 
 # Read the CSV file
 papers_data = []
+seen = set()
+duplicate_ids = load_duplicate_ids()  # from dedup.py; empty until it has been run
 
 with open('publications.csv', 'r', encoding='utf-8') as file:
     csv_reader = csv.reader(file)
@@ -16,9 +19,11 @@ with open('publications.csv', 'r', encoding='utf-8') as file:
         link = row[1]
         
         # Extract PMC ID from link
-        pmc_match = re.search(r'PMC(\d+)', link)
-        if pmc_match:
-            pmc_id = f"PMC{pmc_match.group(1)}"
+        pmc_id = extract_pmc_id(link)
+        if pmc_id:
+            if pmc_id in seen or pmc_id in duplicate_ids:
+                continue
+            seen.add(pmc_id)
             papers_data.append({
                 'title': title,
                 'pmc_id': pmc_id,
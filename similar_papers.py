@@ -0,0 +1,127 @@
+import os
+import numpy as np
+from collections import Counter
+from load_publications import load_all_publications
+from ngram_index import tokenize
+from dedup import load_duplicate_ids
+from fileutils import atomic_output
+
+SIMILAR_PATH = 'similar_papers.npz'
+DATA_FOLDER = 'data/SB_publication'
+TOP_K = 10
+MAX_FEATURES = 4096
+BLOCK_SIZE = 256
+STOPWORDS = {
+    'the', 'and', 'for', 'with', 'that', 'this', 'from', 'are', 'was', 'were', 'has',
+    'have', 'had', 'not', 'but', 'its', 'our', 'their', 'these', 'those', 'which', 'also',
+    'into', 'than', 'between', 'during', 'after', 'before', 'can', 'may', 'been', 'being',
+    'such', 'both', 'each', 'other', 'all', 'any', 'more', 'most', 'use', 'used', 'using',
+    'study', 'studies', 'results', 'however', 'here', 'there', 'fig', 'figure', 'table'
+}
+
+def paper_terms(pub):
+    return [t for t in tokenize(f"{pub['title']} {pub['abstract']} {pub['content']}")
+            if len(t) > 2 and t not in STOPWORDS and not t.isdigit()]
+
+def tfidf_vectors(term_lists, max_features=MAX_FEATURES, max_df=0.5):
+    """Sublinear TF-IDF over the most widespread informative terms, L2-normalized"""
+    n = len(term_lists)
+    df = Counter()
+    for terms in term_lists:
+        df.update(set(terms))
+    ranked = sorted(df.items(), key=lambda item: (-item[1], item[0]))  # ties by term, so rebuilds are reproducible
+    vocab = [t for t, c in ranked if c >= 2 and c <= max_df * n][:max_features]
+    column = {t: i for i, t in enumerate(vocab)}
+    idf = np.log((1 + n) / (1 + np.array([df[t] for t in vocab], dtype=np.float32))) + 1
+
+    vectors = np.zeros((n, len(vocab)), dtype=np.float32)
+    for row, terms in enumerate(term_lists):
+        for term, count in Counter(terms).items():
+            col = column.get(term)
+            if col is not None:
+                vectors[row, col] = 1 + np.log(count)
+    vectors *= idf
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+def quantize(vectors):
+    """Symmetric per-row int8 quantization: vectors ~= codes * scales"""
+    scales = np.abs(vectors).max(axis=1, keepdims=True) / 127
+    scales[scales == 0] = 1
+    codes = np.round(vectors / scales).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+def top_k_neighbors(codes, scales, k=TOP_K, block_size=BLOCK_SIZE):
+    """Cosine top-k for every row, computed one block of rows at a time.
+
+    Only one block of int8 codes is widened to float32 at a time, so memory
+    stays at O(block_size * n) on top of the quantized matrix.
+    """
+    n = len(codes)
+    k = min(k, n - 1)
+    neighbors = np.zeros((n, k), dtype=np.int32)
+    scores = np.zeros((n, k), dtype=np.float16)
+    if k <= 0:
+        return neighbors, scores
+
+    for start in range(0, n, block_size):
+        stop = min(start + block_size, n)
+        rows = codes[start:stop].astype(np.float32) * scales[start:stop]
+        sims = np.empty((stop - start, n), dtype=np.float32)
+        for col in range(0, n, block_size):
+            col_stop = min(col + block_size, n)
+            cols = codes[col:col_stop].astype(np.float32) * scales[col:col_stop]
+            sims[:, col:col_stop] = rows @ cols.T
+        sims[np.arange(stop - start), np.arange(start, stop)] = -np.inf  # not its own neighbor
+
+        best = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+        best_scores = np.take_along_axis(sims, best, axis=1)
+        order = np.argsort(-best_scores, axis=1)
+        neighbors[start:stop] = np.take_along_axis(best, order, axis=1)
+        scores[start:stop] = np.take_along_axis(best_scores, order, axis=1)
+    return neighbors, scores
+
+def build_similar_table(data_folder=DATA_FOLDER, path=SIMILAR_PATH, k=TOP_K):
+    duplicates = load_duplicate_ids()
+    publications = [pub for pub in load_all_publications(data_folder) if pub['pmcid'] not in duplicates]
+    ids = np.array([pub['pmcid'] for pub in publications])
+    print(f"Vectorizing {len(publications)} papers...")
+    vectors = tfidf_vectors([paper_terms(pub) for pub in publications])
+    codes, scales = quantize(vectors)
+    print(f"Computing top-{k} neighbors over {vectors.shape[1]} features...")
+    neighbors, scores = top_k_neighbors(codes, scales, k)
+
+    with atomic_output(path, '.npz') as tmp_path:
+        np.savez(tmp_path, ids=ids, neighbors=neighbors, scores=scores)
+    print(f"Saved {path}")
+
+class SimilarPapers:
+    """Precomputed nearest-neighbor table served with O(1) lookups"""
+
+    def __init__(self, ids, neighbors, scores):
+        self.ids = ids
+        self.neighbors = neighbors
+        self.scores = scores
+        self.rows = {pmcid: row for row, pmcid in enumerate(ids)}
+
+    @classmethod
+    def load(cls, path=SIMILAR_PATH):
+        if not os.path.exists(path):
+            return cls([], np.zeros((0, 0), dtype=np.int32), np.zeros((0, 0), dtype=np.float16))
+        with np.load(path) as table:
+            return cls(table['ids'].tolist(), table['neighbors'], table['scores'])
+
+    def __len__(self):
+        return len(self.ids)
+
+    def similar(self, pmcid, k=TOP_K):
+        """Return [(pmcid, score)] for the k most similar papers, or None if unknown"""
+        if k < 1:
+            raise ValueError('k must be at least 1')
+        row = self.rows.get(pmcid)
+        if row is None:
+            return None
+        return [(self.ids[i], float(s)) for i, s in zip(self.neighbors[row, :k], self.scores[row, :k])]
+
+if __name__ == "__main__":
+    build_similar_table()
@@ -0,0 +1,170 @@
+import asyncio
+import threading
+import concurrent.futures
+
+class _Broadcast:
+    """Chunks of one in-flight stream, replayed to every follower"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self.followers = 0  # guarded by SingleFlight._lock, so joining and abandoning can't race
+        self.waiters = []  # (loop, asyncio.Event) of followers waiting for more
+
+    def publish(self, chunk=None, done=False, error=None):
+        with self.lock:
+            if chunk is not None:
+                self.chunks.append(chunk)
+            if done:
+                self.done = True
+                self.error = error
+            waiters, self.waiters = self.waiters, []
+        for loop, event in waiters:
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:  # that follower's loop is already closed
+                pass
+
+    async def follow(self):
+        loop = asyncio.get_running_loop()
+        position = 0
+        while True:
+            event = None
+            with self.lock:
+                pending = self.chunks[position:]
+                done, error = self.done, self.error
+                if not pending and not done:
+                    event = asyncio.Event()
+                    self.waiters.append((loop, event))
+            if pending:
+                position += len(pending)
+                for chunk in pending:
+                    yield chunk
+            elif done:
+                if error is not None:
+                    raise error
+                return
+            else:
+                await event.wait()
+
+class _LeaderCancelled(Exception):
+    """The leading caller was cancelled; its followers should retry instead of failing"""
+
+class SingleFlight:
+    """Collapse concurrent calls that share a key into one.
+
+    The first caller for a key (the leader) runs the call; callers that arrive
+    while it is in flight wait for its result instead of making their own.
+    Works across threads and event loops, since every Flask request runs its
+    own loop. Nothing is cached: once the call finishes, the next caller
+    starts a new one. Cancellation is never shared: if the leader goes away,
+    a follower takes over the call, and a stream keeps running for as long as
+    anyone is still reading it.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._streams = {}
+        self.stats = {'calls': 0, 'collapsed': 0, 'takeovers': 0, 'streams': 0, 'streams_collapsed': 0}
+
+    def _join(self, table, key, factory, started, collapsed):
+        with self._lock:
+            flight = table.get(key)
+            if flight is None:
+                flight = table[key] = factory()
+                self.stats[started] += 1
+                return flight, True
+            self.stats[collapsed] += 1
+            if isinstance(flight, _Broadcast):
+                flight.followers += 1
+            return flight, False
+
+    def _leave(self, table, key):
+        with self._lock:
+            table.pop(key, None)
+
+    async def do(self, key, fn):
+        """Await fn() once per key across all concurrent callers"""
+        while True:
+            future, leader = self._join(self._calls, key, concurrent.futures.Future, 'calls', 'collapsed')
+            if leader:
+                break
+            try:
+                # Shielded: a follower giving up must not cancel the call for everyone else
+                return await asyncio.shield(asyncio.wrap_future(future))
+            except _LeaderCancelled:
+                self.stats['takeovers'] += 1  # rejoin; the first to get back in runs the call
+
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            # Only this caller went away: free the key before waking the followers
+            self._leave(self._calls, key)
+            future.set_exception(_LeaderCancelled())
+            raise
+        except BaseException as e:
+            self._leave(self._calls, key)
+            future.set_exception(e)  # waiters see the same failure
+            raise
+        self._leave(self._calls, key)
+        future.set_result(result)
+        return result
+
+    async def stream(self, key, fn):
+        """Iterate fn() once per key; every concurrent caller receives all chunks"""
+        broadcast, leader = self._join(self._streams, key, _Broadcast, 'streams', 'streams_collapsed')
+        if not leader:
+            try:
+                async for chunk in broadcast.follow():
+                    yield chunk
+            finally:
+                with self._lock:
+                    broadcast.followers -= 1
+            return
+
+        upstream = fn()
+        try:
+            async for chunk in upstream:
+                broadcast.publish(chunk)
+                yield chunk
+        except GeneratorExit:
+            # The first requester went away; keep the upstream call going for the others
+            await self._drain(key, upstream, broadcast)
+            raise
+        except BaseException as e:
+            self._leave(self._streams, key)
+            if isinstance(e, asyncio.CancelledError):
+                e = RuntimeError('Stream was interrupted')  # the cancellation was the leader's alone
+            broadcast.publish(done=True, error=e)
+            raise
+        else:
+            self._leave(self._streams, key)
+            broadcast.publish(done=True)
+
+    async def _drain(self, key, upstream, broadcast):
+        """Relay the rest of upstream to the followers after the leader has gone"""
+        try:
+            while True:
+                with self._lock:
+                    if broadcast.followers == 0:
+                        self._streams.pop(key, None)  # nobody left; later callers start afresh
+                        break
+                try:
+                    chunk = await upstream.__anext__()
+                except StopAsyncIteration:
+                    self._leave(self._streams, key)
+                    broadcast.publish(done=True)
+                    return
+                broadcast.publish(chunk)
+        except BaseException as e:
+            self._leave(self._streams, key)
+            broadcast.publish(done=True, error=e if isinstance(e, Exception) else RuntimeError('Stream was interrupted'))
+            if not isinstance(e, Exception):
+                raise
+            return
+        finally:
+            await upstream.aclose()
+        broadcast.publish(done=True, error=RuntimeError('Stream was abandoned'))
@@ -0,0 +1,40 @@
+import os
+import json
+import hashlib
+from fileutils import write_json_atomic
+
+SUMMARY_PATH = 'paper_summaries.json'
+SUMMARY_FIELDS = ('findings', 'organism', 'conditions', 'endpoints')
+
+def content_hash(raw):
+    """Hash the raw bytes of a BioC file so summaries can be invalidated when it changes"""
+    return hashlib.sha256(raw).hexdigest()
+
+def file_hash(filepath):
+    with open(filepath, 'rb') as f:
+        return content_hash(f.read())
+
+def load_summaries(path=SUMMARY_PATH):
+    """Load the summary store, keyed by PMC ID"""
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"Error loading summaries from {path}: {e}")
+        return {}
+
+def save_summaries(summaries, path=SUMMARY_PATH):
+    write_json_atomic(summaries, path)
+
+def get_summary(summaries, pmcid, digest):
+    """Return the stored summary for a paper if it was made from the same content"""
+    entry = summaries.get(pmcid)
+    if entry and entry.get('hash') == digest:
+        return entry
+    return None
+
+def format_summary(entry):
+    """Render a stored summary as compact prompt text"""
+    return "\n".join(f"{field.capitalize()}: {entry.get(field, '')}" for field in SUMMARY_FIELDS)
@@ -0,0 +1,465 @@
+import re
+import threading
+import numpy as np
+from html.parser import HTMLParser
+from ngram_index import TrigramIndex
+
+NUMERIC_SHARE = 0.5  # a column is numeric when at least half of its non-empty cells are numbers
+OPERATORS = ('>=', '<=', '!=', '=', '>', '<', '~')
+_CONDITION = re.compile(r'^\s*(.+?)\s*(>=|<=|!=|=|>|<|~)\s*(.+?)\s*$')
+_NUMBER = re.compile(
+    r'^\s*(?:[<>≤≥~≈]=?\s*)?([-+−–]?(?:\d{1,3}(?:,\d{3})+|\d+)(?:\.\d+)?|[-+−–]?\.\d+)'
+    r'(?:\s*[×x]\s*10\^?([-−–]?\d+))?\s*(.*)$'
+)
+# After the number: an optional unit, then nothing or an error/range/footnote marker
+_UNIT = re.compile(r'^(%|[A-Za-zµμ°][A-Za-zµμ°/]{0,7})(?=$|[\s(±,;*†‡])\s*')
+_NUMBER_TAIL = re.compile(r'^(?:$|[±(\[,;*†‡]|\+/?-|[-–]\s*\d|to\b|and\b)')
+_RANGE_END = re.compile(r'^(?:[-–]|to\b)\s*\d[\d,.]*\s*')  # "10–20 days": the unit follows the range
+_HEADER_UNIT = re.compile(r'[(\[]\s*(%|[A-Za-zµμ°][^()\[\]=\s]{0,11})\s*[)\]]\s*$')
+UNIT_ALIASES = {
+    's': 'second', 'sec': 'second', 'min': 'minute', 'h': 'hour', 'hr': 'hour', 'hrs': 'hour', 'd': 'day',
+    'wk': 'week', 'wks': 'week', 'mo': 'month', 'yr': 'year', 'yrs': 'year', 'y': 'year', 'percent': '%'
+}
+# Time values are stored and compared in days, so "1 month" and "30 days" select the same cells
+TIME_UNITS = {'second': 1 / 86400, 'minute': 1 / 1440, 'hour': 1 / 24, 'day': 1.0, 'week': 7.0,
+              'month': 30.4375, 'year': 365.25}
+# Time words in a header without a parsed unit, e.g. "Days in orbit"; no single letters, and no
+# 'min', which is as often "minimum"
+_HEADER_TIME = re.compile(r'\b(seconds?|minutes?|hours?|hrs?|days?|weeks?|wks?|months?|years?|yrs?)\b')
+
+def normalize_unit(unit):
+    unit = unit.strip().lower().rstrip('.')
+    if len(unit) > 3 and unit.endswith('s'):
+        unit = unit[:-1]  # days -> day, mins -> min; 'ms' is a unit of its own
+    return UNIT_ALIASES.get(unit, unit)
+
+def to_days(value, unit):
+    """(value, unit) with time units converted to days; other units pass through"""
+    factor = TIME_UNITS.get(unit)
+    return (value * factor, 'day') if factor else (value, unit)
+
+def header_time_factor(header):
+    """Days per unit of the first time word in a header, NaN if it names none"""
+    match = _HEADER_TIME.search(header)
+    return TIME_UNITS[normalize_unit(match.group(1))] if match else np.nan
+
+def parse_number(text):
+    """Return (value, unit) for cells like '30 days', '1,911 ± 58', '2.5 × 10−3'; None if not numeric"""
+    match = _NUMBER.match(text)
+    if not match:
+        return None
+    number, exponent, rest = match.groups()
+    unit = ''
+    range_end = _RANGE_END.match(rest)
+    after = rest[range_end.end():] if range_end else rest
+    unit_match = _UNIT.match(after)
+    if unit_match:
+        unit = normalize_unit(unit_match.group(1))
+        rest = after[unit_match.end():]
+    if not _NUMBER_TAIL.match(rest):
+        return None  # "5183 MPPR-311-6" is an identifier, not a number
+    value = float(number.replace(',', '').replace('−', '-').replace('–', '-'))
+    if exponent:
+        value *= 10.0 ** int(exponent.replace('−', '-').replace('–', '-'))
+    return value, unit
+
+def _span(value):
+    return max(1, int(value)) if value and value.strip().isdigit() else 1
+
+class _TableParser(HTMLParser):
+    """Collect the rows of a JATS/HTML table as (cells, in_thead); cells are (text, colspan, rowspan, is_th)"""
+
+    def __init__(self):
+        super().__init__()
+        self.rows = []
+        self.in_thead = False
+        self.cell = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'thead':
+            self.in_thead = True
+        elif tag == 'tr':
+            self.rows.append(([], self.in_thead))
+        elif tag in ('td', 'th') and self.rows:
+            attrs = dict(attrs)
+            self.cell = [[], _span(attrs.get('colspan')), _span(attrs.get('rowspan')), tag == 'th']
+        elif tag == 'br' and self.cell is not None:
+            self.cell[0].append(' ')
+
+    def handle_endtag(self, tag):
+        if tag == 'thead':
+            self.in_thead = False
+        elif tag in ('td', 'th') and self.cell is not None:
+            text = ' '.join(''.join(self.cell[0]).split())
+            self.rows[-1][0].append((text, *self.cell[1:]))
+            self.cell = None
+
+    def handle_data(self, data):
+        if self.cell is not None:
+            self.cell[0].append(data)
+
+def parse_table_xml(xml):
+    """Parse table markup into (columns, rows) with row/col spans expanded into a grid"""
+    parser = _TableParser()
+    parser.feed(xml)
+    grid = {}
+    header_rows = set()
+    n_rows = n_cols = 0
+    for r, (cells, in_thead) in enumerate(parser.rows):
+        c = 0
+        for text, colspan, rowspan, _ in cells:
+            while (r, c) in grid:
+                c += 1
+            for dr in range(rowspan):
+                for dc in range(colspan):
+                    grid[(r + dr, c + dc)] = text
+            c += colspan
+        n_cols = max(n_cols, c)
+        n_rows = max(n_rows, r + 1)
+        if in_thead:
+            header_rows.add(r)
+    rows = [[grid.get((r, c), '') for c in range(n_cols)] for r in range(n_rows)]
+
+    if not header_rows:
+        # No <thead>: leading rows made only of <th> cells, else the first row
+        for r, (cells, _) in enumerate(parser.rows):
+            if not cells or not all(is_th for *_, is_th in cells):
+                break
+            header_rows.add(r)
+        if not header_rows and rows:
+            header_rows.add(0)
+
+    columns = []
+    for c in range(n_cols):
+        parts = []
+        for r in sorted(header_rows):
+            text = rows[r][c]
+            if text and text not in parts:  # spanned group headers repeat across columns
+                parts.append(text)
+        columns.append(' '.join(parts) or f'column {c + 1}')
+    body = [row for r, row in enumerate(rows) if r not in header_rows and any(row)]
+    return columns, body
+
+def type_columns(columns, rows):
+    """Per column (is_numeric, unit), plus parse_number() of every cell.
+
+    The column unit comes from the header '(days)' or, failing that, the cells.
+    """
+    parsed = [[parse_number(text) if text else None for text in row] for row in rows]
+    types = []
+    for c, header in enumerate(columns):
+        cells = [row[c] for row in rows if row[c]]
+        numbers = [cell[c] for cell in parsed if cell[c]]
+        numeric = bool(cells) and len(numbers) >= NUMERIC_SHARE * len(cells)
+        match = _HEADER_UNIT.search(header)
+        unit = normalize_unit(match.group(1)) if match else ''
+        if not unit and numbers:
+            cell_units = {u for _, u in numbers if u}
+            unit = cell_units.pop() if len(cell_units) == 1 else ''
+        types.append((numeric, unit))
+    return types, parsed
+
+def extract_tables(passages):
+    """Tables and figure captions from BioC passages.
+
+    Returns (tables, figures). Each table is {'id', 'caption', 'columns',
+    'units', 'numeric', 'rows', 'values'}, where values holds [value, unit] for
+    the numbers in numeric columns and None elsewhere; each figure is
+    {'id', 'caption'}.
+    """
+    captions = {}
+    table_xml = {}
+    figures = {}
+    for passage in passages:
+        infons = passage.get('infons', {})
+        kind = infons.get('type', '')
+        key = infons.get('id', '')
+        text = passage.get('text', '').strip()
+        if kind == 'table' and infons.get('xml'):
+            table_xml[key] = infons['xml']
+        elif kind in ('table_title_caption', 'table_caption') and text:
+            captions.setdefault(key, []).append(text)
+        elif kind in ('fig_title_caption', 'fig_caption') and text:
+            figures.setdefault(key, []).append(text)
+
+    tables = []
+    for key, xml in table_xml.items():
+        try:
+            columns, rows = parse_table_xml(xml)
+        except Exception as e:
+            print(f"Error parsing table {key}: {e}")
+            continue
+        if not rows:
+            continue
+        types, parsed = type_columns(columns, rows)
+        units = [unit for _, unit in types]
+        numeric = [is_numeric for is_numeric, _ in types]
+        tables.append({
+            'id': key,
+            'caption': ' '.join(captions.get(key, [])),
+            'columns': columns,
+            'units': units,
+            'numeric': numeric,
+            'rows': rows,
+            'values': [[[cell[0], units[c] or cell[1]] if cell and numeric[c] else None for c, cell in enumerate(row)]
+                       for row in parsed]
+        })
+    return tables, [{'id': key, 'caption': ' '.join(parts)} for key, parts in figures.items()]
+
+def parse_condition(condition):
+    """'duration > 30 days' -> (field, op, value, number, unit); number is None for text conditions.
+
+    Time values come back in days: 'duration > 1 month' -> number 30.4375, unit 'day'.
+    """
+    match = _CONDITION.match(condition)
+    if not match:
+        raise ValueError(f'Invalid condition: {condition!r} (expected "<column> <op> <value>", op one of {" ".join(OPERATORS)})')
+    field, op, value = match.groups()
+    number = unit = None
+    if op != '~':
+        parsed = parse_number(value)
+        if parsed:
+            number, unit = to_days(*parsed)
+    if op in ('>', '<', '>=', '<=') and number is None:
+        raise ValueError(f'{op} needs a number: {condition!r}')
+    return field.lower(), op, value.lower(), number, unit
+
+class _Vocabulary:
+    """Append-only string -> integer code map shared by every column chunk"""
+
+    def __init__(self, values=()):
+        self.values = []
+        self.codes = {}
+        for value in values:
+            self.code(value)
+
+    def code(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+class TableIndex:
+    """Columnar store over every table cell in the corpus, plus a caption index.
+
+    Cells are kept in long format, one entry per cell: the row it belongs to,
+    integer codes for its column header, text and unit, and a float value
+    (NaN unless the column is numeric). A condition is evaluated as a vectorized
+    mask over those arrays, with header and text matching done over the distinct
+    values only, and conditions are intersected by row.
+
+    Tables are parsed once, when a paper is loaded. Each paper's cells are coded
+    into a column chunk of its own, so an update only builds chunks for the
+    changed papers; the store is then re-concatenated from the cached chunks
+    (an array copy, not a pass over every cell) and swapped in.
+    """
+
+    def __init__(self, publications=()):
+        self._lock = threading.Lock()
+        self.docs = {}    # pmcid -> (tables, figures)
+        self.chunks = {}  # pmcid -> that paper's cell columns
+        # Codes never change once assigned, so published stores stay valid; strings
+        # of removed papers linger until the process restarts
+        self.headers, self.texts, self.units = _Vocabulary(), _Vocabulary(), _Vocabulary([''])
+        self.captions = TrigramIndex()
+        self.store = self._concatenate({})
+        self.update(publications, [])
+
+    def update(self, loaded, dropped):
+        """Corpus listener: re-index loaded papers and drop removed PMC IDs"""
+        loaded = list(loaded)
+        if not loaded and not dropped:
+            return
+        with self._lock:
+            docs, chunks = dict(self.docs), dict(self.chunks)
+            for pmcid in list(dropped) + [pub['pmcid'] for pub in loaded]:
+                for key in self._caption_keys(pmcid, docs.pop(pmcid, None)):
+                    self.captions.remove(key)
+                chunks.pop(pmcid, None)
+            for pub in loaded:
+                entry = docs[pub['pmcid']] = (pub.get('tables', []), pub.get('figures', []))
+                for key, caption in zip(self._caption_keys(pub['pmcid'], entry), self._captions(entry)):
+                    self.captions.add(key, caption)
+                chunks[pub['pmcid']] = self._chunk(pub['pmcid'], entry[0])
+            self.store = self._concatenate(chunks)
+            self.docs, self.chunks = docs, chunks
+
+    @staticmethod
+    def _caption_keys(pmcid, entry):
+        if not entry:
+            return []
+        tables, figures = entry
+        return [(pmcid, 'table', t['id']) for t in tables] + [(pmcid, 'figure', f['id']) for f in figures]
+
+    @staticmethod
+    def _captions(entry):
+        tables, figures = entry
+        return [t['caption'] for t in tables] + [f['caption'] for f in figures]
+
+    def _chunk(self, pmcid, tables):
+        """Code one paper's cells; row and table ids are local to the chunk"""
+        row_table, row_number = [], []
+        cell_row, cell_header, cell_text, cell_unit, cell_value = [], [], [], [], []
+        for t, table in enumerate(tables):
+            header_codes = [self.headers.code(h.lower()) for h in table['columns']]
+            for r, (row, values) in enumerate(zip(table['rows'], table['values'])):
+                row_id = len(row_table)
+                row_table.append(t)
+                row_number.append(r)
+                for c, text in enumerate(row):
+                    if not text:
+                        continue
+                    value, unit = to_days(*(values[c] or (np.nan, table['units'][c])))
+                    cell_row.append(row_id)
+                    cell_header.append(header_codes[c])
+                    cell_text.append(self.texts.code(text.lower()))
+                    cell_unit.append(self.units.code(unit))
+                    cell_value.append(value)
+        return {
+            'tables': [(pmcid, table) for table in tables],
+            'row_table': np.array(row_table, dtype=np.int32),
+            'row_number': np.array(row_number, dtype=np.int32),
+            'cell_row': np.array(cell_row, dtype=np.int32),
+            'cell_header': np.array(cell_header, dtype=np.int32),
+            'cell_text': np.array(cell_text, dtype=np.int32),
+            'cell_unit': np.array(cell_unit, dtype=np.int32),
+            'cell_value': np.array(cell_value, dtype=np.float64)
+        }
+
+    def _concatenate(self, chunks):
+        parts = [chunk for chunk in chunks.values() if chunk['tables']]
+        table_offsets = np.cumsum([0] + [len(chunk['tables']) for chunk in parts])
+        row_offsets = np.cumsum([0] + [len(chunk['row_table']) for chunk in parts])
+
+        def column(name, dtype, offsets=None):
+            arrays = [chunk[name] + offsets[i] if offsets is not None else chunk[name] for i, chunk in enumerate(parts)]
+            return np.concatenate(arrays).astype(dtype, copy=False) if arrays else np.zeros(0, dtype=dtype)
+
+        return {
+            'tables': [entry for chunk in parts for entry in chunk['tables']],
+            'row_table': column('row_table', np.int32, table_offsets),
+            'row_number': column('row_number', np.int32),
+            'cell_row': column('cell_row', np.int32, row_offsets),
+            'cell_header': column('cell_header', np.int32),
+            'cell_text': column('cell_text', np.int32),
+            'cell_unit': column('cell_unit', np.int32),
+            'cell_value': column('cell_value', np.float64),
+            'headers': self.headers.values,
+            'texts': self.texts.values,
+            'units': self.units.values
+        }
+
+    def __len__(self):
+        return len(self.store['tables'])
+
+    def stats(self):
+        store = self.store
+        return {'tables': len(store['tables']), 'rows': len(store['row_table']), 'cells': len(store['cell_row']),
+                'figures': sum(len(figures) for _, figures in self.docs.values())}
+
+    @staticmethod
+    def _codes(vocabulary, predicate, candidates=None):
+        """Codes of the vocabulary entries (optionally only among candidates) that satisfy predicate"""
+        if candidates is None:
+            candidates = range(len(vocabulary))
+        return np.array([i for i in candidates if predicate(vocabulary[i])], dtype=np.int32)
+
+    @staticmethod
+    def _days_per_value(store):
+        """Per cell, the factor that turns its value into days.
+
+        Cells with a time unit were converted to days when coded (factor 1);
+        unitless cells take the time word of their header, if any.
+        """
+        header_factor = np.array([header_time_factor(h) for h in store['headers']] or [np.nan])
+        factor = np.full(len(store['cell_unit']), np.nan)
+        unitless = store['cell_unit'] == 0  # the '' unit
+        factor[unitless] = header_factor[store['cell_header'][unitless]]
+        if 'day' in store['units']:
+            factor[store['cell_unit'] == store['units'].index('day')] = 1.0
+        return factor
+
+    def condition_rows(self, condition, store=None):
+        """Row ids of the store with at least one cell satisfying the condition"""
+        store = store or self.store
+        field, op, value, number, unit = parse_condition(condition)
+        if field in ('*', 'any'):
+            mask = np.ones(len(store['cell_row']), dtype=bool)
+        else:
+            # Whole words, plural allowed: 'age' is not 'dosage' or 'agency', 'p' is not 'protein'
+            pattern = re.compile(rf'(?<!\w){re.escape(field)}(?:e?s)?(?!\w)')
+            mask = np.isin(store['cell_header'], self._codes(store['headers'], lambda h: bool(pattern.search(h))))
+
+        if op in ('>', '<', '>=', '<=') or op == '=' and number is not None:
+            values = store['cell_value']
+            if unit == 'day':
+                values = values * self._days_per_value(store)  # NaN outside time cells and columns
+            compare = {'>': np.greater, '<': np.less, '>=': np.greater_equal, '<=': np.less_equal, '=': np.equal}[op]
+            with np.errstate(invalid='ignore'):
+                mask &= compare(values, number)  # NaN (text cells) never matches
+            if unit and unit != 'day':
+                unit_ok = np.isin(store['cell_unit'], self._codes(store['units'], lambda u: u == unit))
+                header_ok = np.isin(store['cell_header'], self._codes(
+                    store['headers'], lambda h: bool(re.search(rf'\b{re.escape(unit)}', h))))
+                mask &= unit_ok | header_ok
+        else:
+            if op == '~':
+                predicate = lambda t: value in t
+            else:
+                pattern = re.compile(rf'\b{re.escape(value)}')
+                predicate = lambda t: bool(pattern.search(t))
+            # Only test the distinct texts of the columns the field selected
+            candidates = np.unique(store['cell_text'][mask])
+            matched = np.isin(store['cell_text'], self._codes(store['texts'], predicate, candidates))
+            mask &= ~matched if op == '!=' else matched
+        return np.unique(store['cell_row'][mask])
+
+    def query(self, where, caption=None, limit=50):
+        """Rows matching every condition in `where`, optionally only in tables whose caption matches.
+
+        where   -- conditions such as "duration > 30 days" or "organism = mouse";
+                   ops are > >= < <= = != and ~ (substring), and a numeric value
+                   with a unit only matches cells or columns in that unit
+                   (time units are compared in days, so "1 month" = "30.4 days")
+        caption -- keyword query over table captions (see TrigramIndex.search)
+        """
+        if isinstance(where, str):
+            where = [where]
+        if not where and not caption:
+            raise ValueError('Provide at least one condition or a caption query')
+        store = self.store
+        rows = np.arange(len(store['row_table']), dtype=np.int32)
+        for condition in where:
+            rows = np.intersect1d(rows, self.condition_rows(condition, store), assume_unique=True)
+        if caption:
+            wanted = {(pmcid, table_id) for pmcid, kind, table_id in self.captions.search(caption) if kind == 'table'}
+            keep = [t for t, (pmcid, table) in enumerate(store['tables']) if (pmcid, table['id']) in wanted]
+            rows = rows[np.isin(store['row_table'][rows], keep)]
+
+        results = []
+        for row_id in rows[:limit]:
+            pmcid, table = store['tables'][store['row_table'][row_id]]
+            results.append({
+                'pmcid': pmcid,
+                'table': table['id'],
+                'caption': table['caption'],
+                'columns': table['columns'],
+                'values': table['rows'][store['row_number'][row_id]]
+            })
+        return {'where': list(where), 'caption': caption, 'total': int(len(rows)), 'rows': results}
+
+    def search_captions(self, query, mode='auto', kind=None, limit=50):
+        """Table and figure captions matching query: [{'pmcid', 'kind', 'id', 'caption'}]"""
+        docs = self.docs
+        results = []
+        for pmcid, item_kind, item_id in sorted(self.captions.search(query, mode)):
+            if kind and item_kind != kind or pmcid not in docs:
+                continue
+            tables, figures = docs[pmcid]
+            items = tables if item_kind == 'table' else figures
+            caption = next((item['caption'] for item in items if item['id'] == item_id), '')
+            results.append({'pmcid': pmcid, 'kind': item_kind, 'id': item_id, 'caption': caption})
+            if len(results) >= limit:
+                break
+        return results
@@ -0,0 +1,130 @@
+import asyncio
+import threading
+import time
+import pytest
+from llm_scheduler import LLMScheduler, Overloaded, INTERACTIVE, BATCH, is_throttled
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+class RateLimitError(Exception):
+    """Stands in for the provider SDK's rate-limit exception"""
+
+class Throttled(Exception):
+    status_code = 429
+
+def make_scheduler(**kwargs):
+    clock = FakeClock()
+    return LLMScheduler(clock=clock, retry_base_delay=0.0, **kwargs), clock
+
+def test_full_bucket_admits_without_waiting():
+    scheduler, clock = make_scheduler(requests_per_minute=1)
+    scheduler.acquire(INTERACTIVE, 100, deadline=clock() + 30)
+    assert scheduler.stats == {'admitted': 1, 'shed': 0, 'retried': 0}
+
+def test_burst_up_to_bucket_level_is_not_shed():
+    scheduler, clock = make_scheduler(requests_per_minute=60)
+    assert scheduler._estimated_wait([(INTERACTIVE, i, 100) for i in range(40)]) == 0
+    for _ in range(40):
+        scheduler.acquire(INTERACTIVE, 100, deadline=clock() + 1)
+    assert scheduler.stats['admitted'] == 40
+    assert scheduler.stats['shed'] == 0
+
+def test_empty_bucket_sheds_with_retry_after():
+    scheduler, clock = make_scheduler(requests_per_minute=60)
+    scheduler.requests.take(60)
+    with pytest.raises(Overloaded) as e:
+        scheduler.acquire(INTERACTIVE, 100, deadline=clock() + 0.5)
+    assert e.value.retry_after == 1
+    clock.now += 1  # one request refilled
+    scheduler.acquire(INTERACTIVE, 100, deadline=clock() + 0.5)
+    assert scheduler.stats == {'admitted': 1, 'shed': 1, 'retried': 0}
+
+def test_token_budget_is_part_of_the_estimate():
+    scheduler, clock = make_scheduler(requests_per_minute=600, tokens_per_minute=6000)
+    scheduler.tokens.take(6000)
+    with pytest.raises(Overloaded) as e:
+        scheduler.acquire(INTERACTIVE, 3000, deadline=clock() + 5)
+    assert e.value.retry_after == 30
+
+def test_full_queue_sheds():
+    scheduler, clock = make_scheduler(max_queue=0)
+    with pytest.raises(Overloaded):
+        scheduler.acquire(BATCH, 100)
+    assert scheduler.stats['shed'] == 1
+
+def test_cancelled_waiters_leave_the_queue():
+    scheduler = LLMScheduler(requests_per_minute=60, max_queue=4)  # real clock: the bucket refills in seconds
+    scheduler.requests.take(60)
+
+    async def cancel_waiters():
+        waiters = [asyncio.ensure_future(scheduler.admit('prompt', BATCH)) for _ in range(4)]
+        await asyncio.sleep(0.05)
+        assert len(scheduler._queue) == 4
+        for waiter in waiters:
+            waiter.cancel()
+        await asyncio.gather(*waiters, return_exceptions=True)
+
+    asyncio.run(cancel_waiters())
+    for _ in range(100):
+        if not scheduler._queue:
+            break
+        time.sleep(0.01)
+    assert scheduler._queue == []
+    with pytest.raises(Overloaded) as e:  # shed for the empty bucket, not for a full queue
+        scheduler.acquire(INTERACTIVE, 10, deadline=scheduler.clock() + 0.1)
+    assert 'busy' in str(e.value)
+    assert scheduler.stats['admitted'] == 0
+
+def test_interactive_is_admitted_before_batch():
+    scheduler = LLMScheduler(requests_per_minute=600)  # real clock: one request per 0.1s
+    scheduler.requests.take(600)
+    order = []
+    threads = [threading.Thread(target=lambda p=p: (scheduler.acquire(p, 10), order.append(p)))
+               for p in (BATCH, INTERACTIVE)]
+    for thread in threads:
+        thread.start()
+        time.sleep(0.01)
+    for thread in threads:
+        thread.join(2)
+    assert order == [INTERACTIVE, BATCH]
+
+def test_is_throttled():
+    assert is_throttled(Throttled('slow down'))
+    assert is_throttled(RateLimitError('slow down'))
+    try:
+        try:
+            raise RateLimitError('slow down')
+        except RateLimitError as inner:
+            raise RuntimeError('Service failed to complete the prompt') from inner
+    except RuntimeError as wrapped:
+        assert is_throttled(wrapped)
+    assert not is_throttled(Exception('This request resulted in 142911 tokens.'))
+    assert not is_throttled(ValueError('context length exceeded'))
+
+def test_run_retries_throttled_calls_only():
+    scheduler, clock = make_scheduler(max_retries=2)
+    attempts = []
+
+    async def flaky():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise Throttled('slow down')
+        return 'answer'
+
+    assert asyncio.run(scheduler.run(flaky, 'prompt')) == 'answer'
+    assert len(attempts) == 2
+    assert scheduler.stats['retried'] == 1
+
+    async def broken():
+        attempts.append(1)
+        raise ValueError('This request resulted in 142911 tokens.')
+
+    attempts.clear()
+    with pytest.raises(ValueError):
+        asyncio.run(scheduler.run(broken, 'prompt'))
+    assert len(attempts) == 1
@@ -0,0 +1,89 @@
+import os
+import sys
+import json
+import time
+import threading
+import contextvars
+from collections import Counter
+from contextlib import contextmanager
+
+# The trace of the request being handled, shared with coroutines it spawns
+_current = contextvars.ContextVar('trace', default=None)
+_profile_lock = threading.Lock()
+
+def start_trace(name):
+    """Start collecting spans for the current request"""
+    trace = {'name': name, 'start': time.perf_counter(), 'spans': []}
+    _current.set(trace)
+    return trace
+
+@contextmanager
+def span(name):
+    """Time a stage of the current request; a no-op outside a trace"""
+    trace = _current.get()
+    if trace is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace['spans'].append((name, (time.perf_counter() - start) * 1000))
+
+def finish_trace():
+    """Stop the current trace and return it, or None if there was none"""
+    trace = _current.get()
+    if trace is None:
+        return None
+    _current.set(None)
+    trace['total'] = (time.perf_counter() - trace['start']) * 1000
+    return trace
+
+def server_timing(trace):
+    """Format a finished trace as a Server-Timing header value"""
+    parts = [f"{name};dur={ms:.1f}" for name, ms in trace['spans']]
+    parts.append(f"total;dur={trace['total']:.1f}")
+    return ", ".join(parts)
+
+def log_trace(trace, **fields):
+    """Print a finished trace as one JSON line"""
+    record = {
+        'trace': trace['name'],
+        'total_ms': round(trace['total'], 2),
+        'spans': [{'name': name, 'ms': round(ms, 2)} for name, ms in trace['spans']],
+        **fields
+    }
+    print(json.dumps(record))
+
+def _frame_name(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+def sample_profile(seconds, interval=0.005):
+    """Sample the stacks of all other threads for `seconds`.
+
+    Returns the profile in the collapsed-stack format ("root;caller;callee count"
+    per line) understood by flamegraph.pl, speedscope and similar tools.
+    Only one profile can run at a time; returns None if one is already running.
+    """
+    if not _profile_lock.acquire(blocking=False):
+        return None
+    try:
+        own_id = threading.get_ident()
+        names = {t.ident: t.name for t in threading.enumerate()}
+        stacks = Counter()
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_name(frame))
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                stacks[";".join(reversed(stack))] += 1
+            time.sleep(interval)
+        return "\n".join(f"{stack} {count}" for stack, count in stacks.most_common()) + "\n"
+    finally:
+        _profile_lock.release()
@@ -0,0 +1,228 @@
+import io
+import numpy as np
+import pandas as pd
+from ngram_index import TrigramIndex
+
+try:
+    import pyarrow as pa
+except ImportError:  # Arrow output is optional
+    pa = None
+
+YEAR_COLUMNS = ['Fiscal Year', 'Year', 'publication_year', 'Publication Year']
+DATE_COLUMNS = ['Start Date', 'Task Start Date', 'Project Start Date', 'End Date', 'Date']
+TITLE_COLUMN = 'Project Title'
+ABSTRACT_COLUMN = 'Task Abstract/Description'
+BUCKETS = ('year', '5year', 'quarter', 'month')
+NORMALIZE = (None, 'share')
+
+def string_list(name, values):
+    """A request value as a list of strings; a lone string is one item, not its characters"""
+    if values is None:
+        return []
+    if isinstance(values, str):
+        return [values]
+    if not isinstance(values, (list, tuple)) or not all(isinstance(v, str) for v in values):
+        raise ValueError(f'{name} must be a string or a list of strings')
+    return list(values)
+
+class TrendsIndex:
+    """Precomputed integer codes over the TaskBook DataFrame.
+
+    Every categorical column is factorized once into integer codes, and time
+    buckets are stored as codes too. A query then combines boolean masks and
+    counts with a single np.bincount, instead of a row-wise apply per series.
+    Build a new index when the DataFrame changes; an index is never mutated
+    after construction apart from its lazily filled caches.
+    """
+
+    def __init__(self, df):
+        self.df = df
+        self.n = len(df)
+        self.year_col = next((c for c in YEAR_COLUMNS if c in df.columns), None)
+        self.date_col = next((c for c in DATE_COLUMNS if c in df.columns), None)
+        self._codes = {}
+        self._buckets = {}
+
+        if self.year_col:
+            self.years = pd.to_numeric(df[self.year_col], errors='coerce').to_numpy(dtype=float)
+        else:
+            self.years = np.full(self.n, np.nan)
+
+        title = df[TITLE_COLUMN] if TITLE_COLUMN in df.columns else pd.Series('', index=df.index)
+        abstract = df[ABSTRACT_COLUMN] if ABSTRACT_COLUMN in df.columns else pd.Series('', index=df.index)
+        text = title.fillna('').astype(str) + '\n' + abstract.fillna('').astype(str)
+        self.text = text.str.lower().tolist()
+        self.text_index = TrigramIndex()
+        for row, row_text in enumerate(text):
+            self.text_index.add(row, row_text)
+
+        # Warm the caches the default trends view needs
+        if 'Division' in df.columns:
+            self.codes('Division')
+        if self.year_col:
+            self.bucket_codes('year')
+
+    def codes(self, column):
+        """Return (codes, categories) for a column; missing values get code -1"""
+        if column not in self._codes:
+            if column not in self.df.columns:
+                raise ValueError(f'Unknown column: {column}')
+            codes, categories = pd.factorize(self.df[column].astype('object'), sort=True)
+            self._codes[column] = (codes, [str(c) for c in categories])
+        return self._codes[column]
+
+    def bucket_codes(self, bucket):
+        """Return (codes, labels) for a time bucket; rows without a date get code -1"""
+        if bucket not in BUCKETS:
+            raise ValueError(f'Unknown bucket: {bucket} (expected one of {", ".join(BUCKETS)})')
+        if bucket not in self._buckets:
+            if bucket in ('year', '5year'):
+                if not self.year_col:
+                    raise ValueError('No year column found')
+                valid = ~np.isnan(self.years)
+                keys = np.zeros(self.n, dtype=np.int64)
+                keys[valid] = self.years[valid].astype(np.int64)
+                if bucket == '5year':
+                    keys = (keys // 5) * 5
+                uniques = np.unique(keys[valid])
+                codes = np.full(self.n, -1, dtype=np.int64)
+                codes[valid] = np.searchsorted(uniques, keys[valid])
+                if bucket == 'year':
+                    labels = [str(y) for y in uniques]
+                else:
+                    labels = [f'{y}-{y + 4}' for y in uniques]
+            else:
+                if not self.date_col:
+                    raise ValueError(f'No date column found for {bucket} buckets')
+                dates = pd.to_datetime(self.df[self.date_col], errors='coerce')
+                periods = dates.dt.to_period('Q' if bucket == 'quarter' else 'M')
+                codes, uniques = pd.factorize(periods, sort=True)
+                labels = [str(p) for p in uniques]
+            self._buckets[bucket] = (codes, labels)
+        return self._buckets[bucket]
+
+    def match_mask(self, column, values):
+        """Rows whose column contains any of the values (case-insensitive).
+
+        The substring test runs over the distinct categories only; rows are
+        then selected by code.
+        """
+        codes, categories = self.codes(column)
+        wanted = [v.lower() for v in values]
+        matched = [i for i, c in enumerate(categories) if any(v in c.lower() for v in wanted)]
+        return np.isin(codes, matched)
+
+    def keyword_mask(self, keyword, mode='auto'):
+        """Rows whose title or abstract match the keyword.
+
+        'auto' is the case-insensitive substring match the trends view has
+        always used ("gravity" matches "microgravity"); the trigram index only
+        narrows the rows that are checked. When no row contains the keyword it
+        falls back to a fuzzy match, so a typo still finds rows. Other modes
+        go straight to TrigramIndex.search.
+        """
+        mask = np.zeros(self.n, dtype=bool)
+        if mode == 'auto':
+            needle = keyword.lower()
+            candidates = self.text_index.substring_candidates(needle)
+            rows = [r for r in (range(self.n) if candidates is None else candidates) if needle in self.text[r]]
+            if not rows and candidates is not None:
+                rows = list(self.text_index.search(keyword, 'fuzzy'))
+        else:
+            rows = list(self.text_index.search(keyword, mode))
+        mask[rows] = True
+        return mask
+
+    def count(self, mask, bucket_codes, n_buckets):
+        """Count the masked rows per bucket"""
+        selected = bucket_codes[mask & (bucket_codes >= 0)]
+        return np.bincount(selected, minlength=n_buckets)
+
+    def query(self, bucket='year', group_by=None, groups=None, filters=None, keywords=None,
+              normalize=None, top=None):
+        """Run a trends query and return the result in columnar form.
+
+        bucket    -- 'year', '5year', 'quarter' or 'month'
+        group_by  -- categorical column to split into series (None for a single series)
+        groups    -- substrings of group_by values; each becomes one series
+        filters   -- {column: [substrings]} applied before grouping
+        keywords  -- extra series for rows whose title/abstract mention each keyword
+        normalize -- None for counts, 'share' for the fraction of all filtered rows per bucket
+        top       -- keep only the largest N groups when grouping by a whole column
+        """
+        if normalize not in NORMALIZE:
+            raise ValueError(f'Unknown normalize: {normalize}')
+        if group_by is not None and not isinstance(group_by, str):
+            raise ValueError('group_by must be a column name')
+        if filters is not None and not isinstance(filters, dict):
+            raise ValueError('filters must be an object of {column: [values]}')
+        if top is not None and (isinstance(top, bool) or not isinstance(top, int) or top < 1):
+            raise ValueError('top must be a positive integer')
+        groups = string_list('groups', groups)
+        keywords = string_list('keywords', keywords)
+        b_codes, b_labels = self.bucket_codes(bucket)
+        n_buckets = len(b_labels)
+
+        base = np.ones(self.n, dtype=bool)
+        for column, values in (filters or {}).items():
+            base &= self.match_mask(column, string_list(f'filters[{column!r}]', values))
+
+        names, matrix = [], []
+        if group_by and groups:
+            for group in groups:
+                names.append(group)
+                matrix.append(self.count(base & self.match_mask(group_by, [group]), b_codes, n_buckets))
+        elif group_by:
+            g_codes, categories = self.codes(group_by)
+            valid = base & (g_codes >= 0) & (b_codes >= 0)
+            flat = g_codes[valid] * n_buckets + b_codes[valid]
+            counts = np.bincount(flat, minlength=len(categories) * n_buckets).reshape(len(categories), n_buckets)
+            order = np.argsort(-counts.sum(axis=1), kind='stable')
+            if top:
+                order = order[:top]
+            order = [i for i in order if counts[i].any()]
+            names = [categories[i] for i in order]
+            matrix = [counts[i] for i in order]
+        else:
+            names.append('All')
+            matrix.append(self.count(base, b_codes, n_buckets))
+
+        for kw in keywords:
+            names.append(f'"{kw}"')
+            matrix.append(self.count(base & self.keyword_mask(kw), b_codes, n_buckets))
+
+        bucket_totals = self.count(base, b_codes, n_buckets)
+        values = np.vstack(matrix) if matrix else np.zeros((0, n_buckets), dtype=np.int64)
+        totals = values.sum(axis=1)
+
+        keep = bucket_totals > 0  # drop buckets with no rows at all after filtering
+        values = values[:, keep]
+        bucket_totals = bucket_totals[keep]
+        labels = [label for label, k in zip(b_labels, keep) if k]
+
+        if normalize == 'share':
+            values = np.round(values / bucket_totals, 4)
+
+        return {
+            'bucket': bucket,
+            'buckets': labels,
+            'names': names,
+            'totals': totals.tolist(),
+            'values': values.tolist(),
+            'bucket_totals': bucket_totals.tolist(),
+            'normalize': normalize
+        }
+
+def to_arrow(result):
+    """Serialize a query result as an Arrow IPC stream (one column per series)"""
+    if pa is None:
+        raise ValueError('Arrow output requires pyarrow')
+    columns = {'bucket': pa.array(result['buckets'])}
+    value_type = pa.float64() if result['normalize'] else pa.int64()
+    for name, row in zip(result['names'], result['values']):
+        columns[name] = pa.array(row, type=value_type)
+    table = pa.table(columns)
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue()
@@ -0,0 +1,80 @@
+import os
+import threading
+
+class FileWatcher:
+    """Poll files and folders in a background thread and report changes.
+
+    Each watched target keeps a snapshot of (mtime, size) per file. A poll
+    compares a fresh snapshot with the previous one and calls the target's
+    callback with the paths that were added or modified and the paths that
+    disappeared, so listeners only reprocess what actually changed.
+    """
+
+    def __init__(self, interval=2.0):
+        self.interval = interval
+        self._targets = []
+        self._stop = threading.Event()
+        self._thread = None
+
+    def watch_folder(self, folder, callback, suffix='.json'):
+        """Watch every file ending in `suffix` directly inside `folder`"""
+        target = {'folder': folder, 'suffix': suffix, 'callback': callback}
+        target['stamps'] = self._snapshot(target)
+        self._targets.append(target)
+
+    def watch_file(self, path, callback):
+        """Watch a single file, which may not exist yet"""
+        target = {'file': str(path), 'callback': callback}
+        target['stamps'] = self._snapshot(target)
+        self._targets.append(target)
+
+    def _snapshot(self, target):
+        stamps = {}
+        if 'file' in target:
+            paths = [target['file']]
+        else:
+            try:
+                paths = [os.path.join(target['folder'], name)
+                         for name in os.listdir(target['folder'])
+                         if name.endswith(target['suffix'])]
+            except FileNotFoundError:
+                paths = []
+
+        for path in paths:
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            stamps[path] = (st.st_mtime_ns, st.st_size)
+        return stamps
+
+    def poll(self):
+        """Check all targets once and dispatch callbacks for any deltas"""
+        for target in self._targets:
+            old = target['stamps']
+            new = self._snapshot(target)
+            changed = [p for p, stamp in new.items() if old.get(p) != stamp]
+            removed = [p for p in old if p not in new]
+            target['stamps'] = new
+            if not changed and not removed:
+                continue
+            try:
+                target['callback'](changed, removed)
+            except Exception as e:
+                print(f"Error applying changes ({len(changed)} changed, {len(removed)} removed): {e}")
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.poll()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='file-watcher', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None